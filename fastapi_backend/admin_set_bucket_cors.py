@@ -0,0 +1,26 @@
+"""
+One-off admin command: sets the CORS policy of the books bucket so pdf.js can
+fetch signed URLs from the browser. Run it once per bucket, not on app startup:
+    python admin_set_bucket_cors.py [--origin https://your-frontend.com]
+"""
+import argparse
+from storage import get_bucket
+
+
+def main(origins: list[str]):
+    bucket = get_bucket()
+    bucket.cors = [{
+        "origin": origins,
+        "responseHeader": ["Content-Type"],
+        "method": ["GET", "HEAD"],
+        "maxAgeSeconds": 3600
+    }]
+    bucket.patch()
+    print(f"CORS set on {bucket.name}: {bucket.cors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--origin", action="append", help="Allowed origin, repeatable (default: *)")
+    args = parser.parse_args()
+    main(args.origin or ["*"])
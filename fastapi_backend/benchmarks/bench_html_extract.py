@@ -0,0 +1,87 @@
+"""
+HTML extraction benchmark over the LibGen fixtures (benchmarks/fixtures/).
+
+For every installed backend of html_extract.py, checks that the search
+results, mirror link and GET link extracted from each fixture are identical to
+the bs4 reference (errors included), then reports the time per page. The search
+fixture is also replicated to a 100-row page, the size of a `number=100` search.
+
+Usage (from fastapi_backend/):
+    python benchmarks/bench_html_extract.py --iterations 200
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from html_extract import BACKENDS
+from mock_libgen import read_fixture
+
+DETAIL_URL = "https://libgen.is/book/index.php?md5=00000000000000000000000000000001"
+
+
+def large_search_page(rows: int) -> str:
+    html = read_fixture("libgen_search.html")
+    body = re.findall(r"<tr valign=top bgcolor=\"[^\"]*\">.*?</tr>", html, re.S)
+    repeated = "\n".join(body[i % len(body)] for i in range(rows))
+    return html.replace("\n".join(body), repeated)
+
+def outcome(call, *args):
+    try:
+        return call(*args)
+    except ValueError as e:
+        return f"ValueError: {e}"
+
+def extract_all(extractor, html: str):
+    return (outcome(extractor.search_results, html),
+            outcome(extractor.mirror_link, html, DETAIL_URL),
+            outcome(extractor.download_link, html))
+
+def main(iterations: int):
+    extractors = []
+    for name, backend in BACKENDS.items():
+        try:
+            extractors.append(backend())
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+    pages = {
+        "search (6 rows)": read_fixture("libgen_search.html"),
+        "search (100 rows)": large_search_page(100),
+        "detail": read_fixture("libgen_detail.html"),
+        "mirror": read_fixture("libgen_mirror.html"),
+    }
+    reference = next(e for e in extractors if e.name == "bs4")
+    for label, html in pages.items():
+        expected = extract_all(reference, html)
+        for extractor in extractors:
+            if extract_all(extractor, html) != expected:
+                raise SystemExit(f"{extractor.name} differs from bs4 on {label}")
+    print("all backends return identical results\n")
+
+    # What each page is parsed for by the API
+    tasks = {
+        "search (6 rows)": lambda e, h: e.search_results(h),
+        "search (100 rows)": lambda e, h: e.search_results(h),
+        "detail": lambda e, h: e.mirror_link(h, DETAIL_URL),
+        "mirror": lambda e, h: e.download_link(h),
+    }
+    print(f"{'page':<20}" + "".join(f"{e.name:>14}" for e in extractors))
+    for label, html in pages.items():
+        timings = []
+        for extractor in extractors:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                tasks[label](extractor, html)
+            timings.append((time.perf_counter() - start) * 1000 / iterations)
+        print(f"{label:<20}" + "".join(f"{ms:>12.3f}ms" for ms in timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,109 @@
+"""
+LibGen client benchmark against the local mock mirror (benchmarks/mock_libgen.py).
+
+Runs N concurrent searches and downloads, as N simultaneous requests to the
+API would, with:
+  - the old blocking helpers (requests, no session) called from coroutines
+  - the pooled async LibGenClient, downloads streamed chunk by chunk
+and reports the wall time, the longest event-loop stall seen by a 10 ms
+heartbeat task (how long every other request of the API would be frozen) and
+the peak Python memory allocated. Finally a download whose connection drops
+halfway is checked to resume with a Range request and hash correctly.
+
+Usage (from fastapi_backend/):
+    python benchmarks/bench_libgen_client.py --concurrency 20 --delay 0.2
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import utility_functions
+from libgen_client import LibGenClient
+from mock_libgen import MockLibGen
+
+
+async def measure(label: str, calls):
+    stalls = []
+    stop = asyncio.Event()
+
+    async def heartbeat():
+        while not stop.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append(time.perf_counter() - before - 0.01)
+
+    beat = asyncio.create_task(heartbeat())
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = await asyncio.gather(*calls)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stop.set()
+    await beat
+    print(f"{label:>28}: {elapsed:6.2f}s, max event-loop stall {max(stalls, default=0) * 1000:7.1f}ms, "
+          f"peak memory {peak / 2**20:6.1f} MiB")
+    return results
+
+async def streamed_download(client: LibGenClient, detail_url: str, chunk_size: int = 256 * 1024):
+    """What /libgen-upload/ does, with a hashing sink in place of the storage upload."""
+    url = await client.resolve_download_url(detail_url)
+    digest = hashlib.sha256()
+    async with client.open_download(url, 1 << 40) as download:
+        while chunk := await download.read(chunk_size):
+            digest.update(chunk)
+        return download.filename, download.received, digest.hexdigest(), download.resumes
+
+async def main(concurrency: int, delay: float, file_kib: int):
+    with MockLibGen(delay, file_kib * 1024) as mock:
+        expected_sha = hashlib.sha256(mock.content).hexdigest()
+        search_url = f"{mock.base_url}/search.php"
+        detail_url = f"{mock.base_url}/book/index.php?md5=00000000000000000000000000000001"
+        utility_functions.LIBGEN_SEARCH_URL = search_url
+
+        async def blocking_search():
+            return utility_functions.fetch_libgen_books("knuth", 25)
+
+        async def blocking_download():
+            return utility_functions.download_libgen_file(detail_url)
+
+        client = LibGenClient(search_url, max_connections=concurrency, per_host_concurrency=concurrency,
+                              connect_timeout=5, read_timeout=30)
+        try:
+            # One-off setup (TLS context, pools) is not part of the steady state being compared
+            client.client
+            await measure("search, blocking requests", [blocking_search() for _ in range(concurrency)])
+            results = await measure("search, pooled async client", [client.search("knuth", 25) for _ in range(concurrency)])
+            assert all(len(books) == len(results[0]) > 0 for books in results)
+            await measure("download, blocking requests", [blocking_download() for _ in range(concurrency)])
+            results = await measure("download, streamed async", [streamed_download(client, detail_url)
+                                                                for _ in range(concurrency)])
+            assert all(name == "book.pdf" and sha == expected_sha for name, _, sha, _ in results)
+        finally:
+            await client.close()
+
+    with MockLibGen(0, file_kib * 1024, drop_after=file_kib * 1024 // 2) as mock:
+        client = LibGenClient(f"{mock.base_url}/search.php", 4, 4, connect_timeout=5, read_timeout=30)
+        try:
+            detail_url = f"{mock.base_url}/book/index.php?md5=00000000000000000000000000000001"
+            _, size, sha, resumes = await streamed_download(client, detail_url)
+        finally:
+            await client.close()
+        assert sha == hashlib.sha256(mock.content).hexdigest() and size == len(mock.content)
+        print(f"dropped connection: resumed {resumes}x with {mock.range_requests} Range request(s), content intact")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.2, help="Mock mirror latency per request (s)")
+    parser.add_argument("--file-kib", type=int, default=1024)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.delay, args.file_kib))
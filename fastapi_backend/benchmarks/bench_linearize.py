@@ -0,0 +1,190 @@
+"""
+Bytes pdf.js fetches before it can render page one, with and without linearization.
+
+pdf.js loads PDFs with HTTP Range requests in 64 KiB chunks. This simulates
+which chunks it needs before the first page can be drawn:
+  - the first chunk (header, linearization dictionary and first-page xref if any)
+  - the cross-reference sections it follows from startxref (found by reading
+    the last chunk, or right after the linearization dictionary)
+  - every object of page one: the page, its ancestors in the page tree, the
+    catalog and everything the page references (contents, fonts, images), with
+    object offsets and lengths taken from the xref tables via pypdf
+Linearized files keep the first page's objects together at the start, so
+they need far fewer chunks.
+
+Without --pdf, a synthetic "scanned textbook" is generated (one large image per
+page, written in the order streaming scan tools use: every page's image and
+contents as scanned, then the page objects, page tree and catalog at the end).
+
+Usage (from fastapi_backend/):
+    python benchmarks/bench_linearize.py --pages 300
+    python benchmarks/bench_linearize.py --pdf book.pdf
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject
+from pdf_optimize import is_linearized, linearize_pdf
+
+CHUNK = 64 * 1024
+PREV_PATTERN = re.compile(rb"/Prev\s+(\d+)")
+
+
+def synthetic_scan(path: str, pages: int, image_bytes: int, seed: int = 0):
+    """Writes a scanner-style PDF: each page's image and contents as scanned, page tree and catalog last."""
+    rng = random.Random(seed)
+    side = int((image_bytes / 3) ** 0.5)
+    offsets = {}
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+        def write_object(num, body):
+            offsets[num] = f.tell()
+            f.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+
+        def stream(data, extra=b""):
+            return b"<< /Length %d %s>>\nstream\n" % (len(data), extra) + data + b"\nendstream"
+
+        # Objects 1 and 2 are the catalog and page tree; page i uses 3 + 3i (image), +1 (contents), +2 (page)
+        for i in range(pages):
+            image = rng.randbytes(side * side * 3)
+            write_object(3 + 3 * i, stream(image, b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+                                                  b"/BitsPerComponent 8 /ColorSpace /DeviceRGB " % (side, side)))
+            write_object(4 + 3 * i, stream(b"q 612 0 0 792 0 0 cm /Im0 Do Q"))
+        for i in range(pages):
+            write_object(5 + 3 * i, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                                    b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                                    % (3 + 3 * i, 4 + 3 * i))
+        kids = b" ".join(b"%d 0 R" % (5 + 3 * i) for i in range(pages))
+        write_object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages))
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = f.tell()
+        count = 3 + 3 * pages
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        for num in range(1, count):
+            f.write(b"%010d 00000 n \n" % offsets[num])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+
+def object_spans(reader: PdfReader, size: int):
+    """idnum -> (start, end) byte span in the file; objects in object streams map to their stream."""
+    offsets = {idnum: offset for table in reader.xref.values() for idnum, offset in table.items()}
+    boundaries = sorted(set(offsets.values()) | {size})
+    following = {b: boundaries[i + 1] for i, b in enumerate(boundaries[:-1])}
+    spans = {idnum: (offset, following.get(offset, size)) for idnum, offset in offsets.items()}
+    for idnum, (stream_num, _) in reader.xref_objStm.items():
+        if stream_num in spans:
+            spans[idnum] = spans[stream_num]
+    return spans
+
+def first_page_objects(reader: PdfReader):
+    """Object numbers needed to render page one."""
+    needed = set()
+
+    def walk(value, follow_parent=False):
+        if isinstance(value, IndirectObject):
+            if value.idnum in needed:
+                return
+            needed.add(value.idnum)
+            value = value.get_object()
+        if isinstance(value, DictionaryObject):
+            for key, item in value.items():
+                # Other pages and back references are not needed for page one
+                if key in ("/Parent", "/Kids", "/P") and not follow_parent:
+                    continue
+                walk(item)
+            if follow_parent and "/Parent" in value:
+                walk_ancestor(value.raw_get("/Parent"))
+        elif isinstance(value, ArrayObject):
+            for item in value:
+                walk(item)
+
+    def walk_ancestor(ref):
+        if isinstance(ref, IndirectObject):
+            needed.add(ref.idnum)
+            node = ref.get_object()
+            if "/Parent" in node:
+                walk_ancestor(node.raw_get("/Parent"))
+
+    root = reader.trailer.raw_get("/Root")
+    needed.add(root.idnum)
+    walk(reader.pages[0].indirect_reference, follow_parent=True)
+    walk(reader.pages[0].get_object(), follow_parent=True)
+    return needed
+
+def chunks_for(start: int, end: int) -> set:
+    return set(range(start // CHUNK, max(start, end - 1) // CHUNK + 1))
+
+def xref_sections(f, start: int) -> list:
+    """Offsets of the cross-reference sections reached from `start` by following /Prev."""
+    sections = []
+    while start is not None and start not in sections:
+        sections.append(start)
+        f.seek(start)
+        head = f.read(CHUNK)
+        if head.lstrip().startswith(b"xref"):
+            # Classic table: /Prev is in the trailer dictionary that follows it
+            trailer = head[head.find(b"trailer"):head.find(b"startxref")]
+        else:
+            # Cross-reference stream: /Prev is in the stream dictionary
+            trailer = head[:head.find(b"stream")]
+        match = PREV_PATTERN.search(trailer)
+        start = int(match.group(1)) if match else None
+    return sections
+
+def bytes_before_first_render(path: str) -> dict:
+    size = os.path.getsize(path)
+    reader = PdfReader(path)
+    spans = object_spans(reader, size)
+    boundaries = sorted({span[0] for span in spans.values()} | {size})
+    linearized = is_linearized(path)
+    chunks = {0}
+    with open(path, "rb") as f:
+        if linearized:
+            # pdf.js starts with the first-page xref right after the linearization dictionary
+            f.seek(0)
+            head = f.read(CHUNK)
+            startxref = head.index(b"endobj") + len(b"endobj")
+        else:
+            # Otherwise it reads the end of the file to find startxref
+            chunks |= chunks_for(max(0, size - 1024), size)
+            f.seek(max(0, size - 1024))
+            tail = f.read()
+            startxref = int(tail[tail.rindex(b"startxref") + 9:].split()[0])
+        for section in xref_sections(f, startxref):
+            end = next((b for b in boundaries if b > section), size)
+            chunks |= chunks_for(section, end)
+    for idnum in first_page_objects(reader):
+        if idnum in spans:
+            chunks |= chunks_for(*spans[idnum])
+    fetched = sum(min(CHUNK, size - c * CHUNK) for c in chunks)
+    return {"size": size, "chunks": len(chunks), "fetched": fetched, "linearized": linearized}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", help="PDF to measure; a synthetic scan is generated when omitted")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--image-kib", type=int, default=150)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.pdf
+        if source is None:
+            source = os.path.join(tmp, "scan.pdf")
+            synthetic_scan(source, args.pages, args.image_kib * 1024)
+        optimized = os.path.join(tmp, "linearized.pdf")
+        linearize_pdf(source, optimized)
+        for label, path in (("original", source), ("linearized", optimized)):
+            r = bytes_before_first_render(path)
+            print(f"{label:>10}: file {r['size'] / 2**20:.1f} MiB, linearized={r['linearized']}, "
+                  f"{r['chunks']} chunks / {r['fetched'] / 1024:.0f} KiB before first render")
+
+
+if __name__ == "__main__":
+    main()
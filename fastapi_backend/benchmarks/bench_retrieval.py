@@ -0,0 +1,81 @@
+"""
+Benchmark of the book retrieval index with the deterministic hashing embedder.
+
+Builds a memory-mapped vector matrix for a synthetic book (no Mongo, no API
+calls), checks that a passage is retrieved by a question built from its own
+words, and compares the vectorized top-k search with a per-chunk Python loop.
+
+Usage (from fastapi_backend/):
+    python benchmarks/bench_retrieval.py --pages 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from retrieval import HashingEmbedder, chunk_pages, normalize_rows, top_k
+
+WORDS = [f"word{i}" for i in range(5000)]
+
+
+def synthetic_pages(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(400)) for _ in range(count)]
+
+async def main(pages_count: int, dim: int, k: int, queries: int):
+    embedder = HashingEmbedder(dim)
+    pages = synthetic_pages(pages_count)
+    chunks = chunk_pages(pages, 1500, 200)
+
+    start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(chunks), 64):
+        vectors.append(normalize_rows(await embedder.embed([c["text"] for c in chunks[i:i + 64]])))
+    matrix = np.concatenate(vectors).astype(np.float32)
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "vectors.f32")
+        matrix.tofile(path)
+        mapped = np.memmap(path, dtype=np.float32, mode="r", shape=matrix.shape)
+
+        rng = random.Random(1)
+        targets = [rng.randrange(len(chunks)) for _ in range(queries)]
+        questions = [" ".join(chunks[t]["text"].split()[:30]) for t in targets]
+        query_vectors = normalize_rows(await embedder.embed(questions)).astype(np.float32)
+
+        start = time.perf_counter()
+        hits = 0
+        for target, vector in zip(targets, query_vectors):
+            best, _ = top_k(mapped, vector, k)
+            hits += target in best.tolist()
+        vectorized_ms = (time.perf_counter() - start) * 1000 / queries
+
+        start = time.perf_counter()
+        for vector in query_vectors[:max(1, queries // 10)]:
+            rows = matrix.tolist()
+            q = vector.tolist()
+            scores = [sum(a * b for a, b in zip(row, q)) for row in rows]
+            sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+        loop_ms = (time.perf_counter() - start) * 1000 / max(1, queries // 10)
+
+    print(f"chunks={len(chunks)} dim={dim} build={build_s:.2f}s "
+          f"({len(chunks) / build_s:.0f} chunks/s)")
+    print(f"recall@{k}={hits / queries:.2f}")
+    print(f"search per query: vectorized memmap {vectorized_ms:.2f}ms, python loop {loop_ms:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.pages, args.dim, args.k, args.queries))
@@ -0,0 +1,108 @@
+"""
+Startup-time benchmark for the FastAPI backend.
+
+Measures:
+  - import time of main.py (python -X importtime), with the slowest modules
+  - time to first request: uvicorn launch until GET /metrics answers 200
+
+No credentials or running services are needed: importing and starting the
+app must stay free of network I/O. Each run appends one JSON line to
+benchmarks/startup_results.jsonl so regressions show up in the history.
+
+Usage (from fastapi_backend/):
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import datetime
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(BACKEND_DIR, "benchmarks", "startup_results.jsonl")
+
+
+def import_time():
+    """Returns (total seconds, [(cumulative seconds, module)] of the slowest top-level imports)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1e6, name.rstrip()))
+    total = next(c for c, name in rows if name.strip() == "main")
+    # Direct imports of main are indented by two more spaces than main itself
+    top = sorted(((c, n.strip()) for c, n in rows if n.startswith("   ") and not n.startswith("    ")), reverse=True)
+    return total, top[:8]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def time_to_first_request(timeout: float = 30.0):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("server did not answer in time")
+    finally:
+        server.terminate()
+        server.wait()
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main(runs: int):
+    imports = [import_time() for _ in range(runs)]
+    first_requests = [time_to_first_request() for _ in range(runs)]
+    import_median = statistics.median(total for total, _ in imports)
+    first_request_median = statistics.median(first_requests)
+
+    print(f"import main:            {import_median * 1000:8.1f} ms (median of {runs})")
+    print(f"time to first request:  {first_request_median * 1000:8.1f} ms (median of {runs})")
+    print("slowest imports:")
+    for cumulative, name in imports[-1][1]:
+        print(f"  {cumulative * 1000:8.1f} ms  {name}")
+
+    record = {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "import_ms": round(import_median * 1000, 1),
+        "first_request_ms": round(first_request_median * 1000, 1),
+        "slowest_imports_ms": {name: round(c * 1000, 1) for c, name in imports[-1][1]},
+    }
+    with open(RESULTS_FILE, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    main(args.runs)
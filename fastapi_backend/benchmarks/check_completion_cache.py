@@ -0,0 +1,132 @@
+"""
+Offline checks of completion_cache.CompletionCache, with a fake model client in
+place of OpenAI (no network, no database).
+
+Covers:
+  - key normalization (case and whitespace) and what still changes the key
+  - TTL expiry and LRU eviction of the memory tier
+  - the disk tier: hit after a restart, expiry, pruning to max_disk_entries
+  - /get_bot_response: a repeated question is served from the cache, and
+    bypassCache calls the model again and counts the bypass
+
+Usage (from fastapi_backend/):
+    python benchmarks/check_completion_cache.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from completion_cache import CompletionCache
+
+
+class FakeLLM:
+    """Stands in for LLMClient: counts calls and answers with the call number."""
+    def __init__(self):
+        self.calls = 0
+
+    async def chat(self, messages: list, model: str, user_key: str | None = None) -> str:
+        self.calls += 1
+        return f"answer {self.calls}"
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"calls": self.calls}
+
+
+def check_keys():
+    key = CompletionCache.key
+    base = key("gpt", [{"role": "user", "content": "What is  a Monad?"}])
+    assert key("gpt", [{"role": "user", "content": "  what is a\nmonad? "}]) == base
+    assert key("gpt-other", [{"role": "user", "content": "What is a Monad?"}]) != base
+    assert key("gpt", [{"role": "system", "content": "What is a Monad?"}]) != base
+    assert key("gpt", [{"role": "user", "content": "What is a Monoid?"}]) != base
+    print("keys: case and whitespace ignored; model, role and wording still matter")
+
+async def check_memory_tier():
+    cache = CompletionCache(max_entries=2, ttl=0.2)
+    await cache.set("a", "A")
+    await cache.set("b", "B")
+    assert await cache.get("a") == "A"      # "a" is now the most recently used
+    await cache.set("c", "C")               # evicts "b"
+    assert await cache.get("b") is None and await cache.get("a") == "A"
+    assert cache.memory.stats()["evictions"] == 1
+    await asyncio.sleep(0.25)
+    assert await cache.get("a") is None and await cache.get("c") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 3), stats
+    print("memory tier: least recently used evicted, entries expire after the TTL")
+
+async def check_disk_tier():
+    with tempfile.TemporaryDirectory() as disk_dir:
+        cache = CompletionCache(max_entries=10, ttl=0.3, disk_dir=disk_dir, max_disk_entries=5)
+        await cache.set("k", "V")
+        # A new process: empty memory tier, same directory
+        restarted = CompletionCache(max_entries=10, ttl=0.3, disk_dir=disk_dir, max_disk_entries=5)
+        assert await restarted.get("k") == "V" and restarted.disk_hits == 1
+        assert await restarted.get("k") == "V" and restarted.disk_hits == 1   # Promoted to memory
+        await asyncio.sleep(0.35)
+        fresh = CompletionCache(max_entries=10, ttl=0.3, disk_dir=disk_dir, max_disk_entries=5)
+        assert await fresh.get("k") is None
+        assert not os.path.exists(os.path.join(disk_dir, "k.json")), "expired file not removed"
+
+        pruned = CompletionCache(max_entries=10, ttl=60, disk_dir=disk_dir, max_disk_entries=5)
+        for i in range(99):
+            await pruned.set(f"entry-{i}", str(i))
+            # Distinct write times, oldest first
+            written = time.time() - 1000 + i
+            os.utime(os.path.join(disk_dir, f"entry-{i}.json"), (written, written))
+        await pruned.set("entry-99", "99")  # The 100th write prunes
+        left = sorted(name for name in os.listdir(disk_dir) if name.endswith(".json"))
+        assert left == [f"entry-{i}.json" for i in range(95, 100)], left
+    print("disk tier: hit after restart, expired files removed, pruned to the 5 newest")
+
+def check_endpoint():
+    from fastapi.testclient import TestClient
+    import main
+
+    llm = FakeLLM()
+    main.llm = llm
+    main.completion_cache = CompletionCache(max_entries=100, ttl=60)
+
+    async def build_chat_messages(sessionId, question, context=None):
+        return [{"role": "user", "content": question}]
+
+    async def nothing(*args, **kwargs):
+        return None
+
+    async def user_key(sessionId):
+        return "user-1"
+
+    main.build_chat_messages = build_chat_messages
+    main.book_context = nothing
+    main.add_chat_turn = nothing
+    main.llm_user_key = user_key
+    main.is_first_turn = lambda messages: False
+
+    client = TestClient(main.app)   # No lifespan: nothing touches MongoDB
+    ask = lambda question, **extra: client.post(
+        "/get_bot_response", json={"sessionId": "s1", "question": question, **extra}).json()["response"]
+    assert ask("What is a monad?") == "answer 1"
+    assert ask("  what is a MONAD? ") == "answer 1" and llm.calls == 1
+    assert ask("What is a monad?", bypassCache=True) == "answer 2" and llm.calls == 2
+    assert ask("What is a monad?") == "answer 2"   # The bypassing answer refreshed the cache
+    stats = main.completion_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bypassed"]) == (2, 1, 1), stats
+    print(f"endpoint: {llm.calls} model calls for 4 requests, bypass counted")
+
+async def main_checks():
+    check_keys()
+    await check_memory_tier()
+    await check_disk_tier()
+    check_endpoint()
+    print("all completion cache checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_checks())
@@ -0,0 +1,122 @@
+"""
+Offline checks of llm_client.LLMClient against the local OpenAI stub (benchmarks/mock_openai.py).
+
+Covers:
+  - 429 -> 429 -> 200 is retried, honouring Retry-After
+  - persistent 5xx ends in LLMUnavailableError after max_retries, which the API answers with 503
+  - 4xx other than 429 is not retried
+  - the per-user and global concurrency caps
+  - streamed completions and embeddings
+
+Usage (from fastapi_backend/):
+    python benchmarks/check_llm_client.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+
+from llm_client import LLMClient, LLMUnavailableError
+from mock_openai import MockOpenAI, ANSWER, EMBEDDING_DIM
+
+MESSAGES = [{"role": "user", "content": "What is the answer?"}]
+
+
+def make_client(mock: MockOpenAI, max_concurrency: int = 8, per_user_concurrency: int = 2,
+                max_retries: int = 3) -> LLMClient:
+    # AsyncOpenAI reads the base URL from the environment when the client is first used
+    os.environ["OPENAI_BASE_URL"] = mock.base_url
+    return LLMClient(max_connections=16, max_concurrency=max_concurrency, per_user_concurrency=per_user_concurrency,
+                     connect_timeout=5, timeout=10, max_retries=max_retries, backoff_base=0.01, backoff_max=1)
+
+async def check_retry_after():
+    with MockOpenAI(failures=[(429, {"Retry-After": "0.2"}), (429, {"Retry-After": "0.2"})]) as mock:
+        llm = make_client(mock)
+        try:
+            llm.client  # Import openai and build the client outside the timing
+            start = time.perf_counter()
+            answer = await llm.chat(MESSAGES, "gpt-mock")
+            elapsed = time.perf_counter() - start
+        finally:
+            await llm.close()
+    stats = llm.stats()
+    assert answer == ANSWER, answer
+    assert (mock.requests, stats["retries"], stats["errors"]) == (3, 2, 2), (mock.requests, stats)
+    assert elapsed >= 0.4, f"Retry-After not honoured ({elapsed:.2f}s)"
+    print(f"429 -> 429 -> 200: answered after 2 retries in {elapsed:.2f}s (Retry-After 0.2s each)")
+
+async def check_unavailable():
+    with MockOpenAI(failures=[(503, {})] * 10) as mock:
+        llm = make_client(mock, max_retries=2)
+        try:
+            await llm.chat(MESSAGES, "gpt-mock")
+            raise AssertionError("expected LLMUnavailableError")
+        except LLMUnavailableError as e:
+            error = e
+        finally:
+            await llm.close()
+    assert mock.requests == 3, mock.requests
+    # The API's exception handler turns it into a 503
+    from main import llm_unavailable_handler
+    response = await llm_unavailable_handler(None, error)
+    assert response.status_code == 503 and "detail" in json.loads(response.body)
+    print(f"persistent 503: gave up after {mock.requests} attempts, API answers {response.status_code}")
+
+async def check_not_retried():
+    from openai import BadRequestError
+    with MockOpenAI(failures=[(400, {})]) as mock:
+        llm = make_client(mock)
+        try:
+            await llm.chat(MESSAGES, "gpt-mock")
+            raise AssertionError("expected BadRequestError")
+        except BadRequestError:
+            pass
+        finally:
+            await llm.close()
+    assert mock.requests == 1 and llm.stats()["retries"] == 0
+    print("400: raised at once, not retried")
+
+async def check_concurrency():
+    with MockOpenAI(delay=0.2) as mock:
+        llm = make_client(mock, max_concurrency=3, per_user_concurrency=2)
+        try:
+            await asyncio.gather(*(llm.chat(MESSAGES, "gpt-mock", user_key="user-1") for _ in range(6)))
+            one_user = mock.max_in_flight
+            mock.max_in_flight = 0
+            await asyncio.gather(*(llm.chat(MESSAGES, "gpt-mock", user_key=f"user-{i}") for i in range(8)))
+            many_users = mock.max_in_flight
+        finally:
+            await llm.close()
+    assert one_user == 2, one_user
+    assert many_users == 3, many_users
+    assert llm.stats()["users_waiting_or_active"] == 0
+    print(f"concurrency: {one_user} in flight for one user, {many_users} across users (caps 2 and 3)")
+
+async def check_stream_and_embed():
+    with MockOpenAI() as mock:
+        llm = make_client(mock)
+        try:
+            tokens = [token async for token in llm.chat_stream(MESSAGES, "gpt-mock", user_key="user-1")]
+            vectors = await llm.embed(["a", "bb", "ccc"], "embedding-mock")
+        finally:
+            await llm.close()
+    assert "".join(tokens).strip() == ANSWER, tokens
+    assert len(vectors) == 3 and all(len(v) == EMBEDDING_DIM for v in vectors)
+    print(f"stream: {len(tokens)} tokens; embeddings: {len(vectors)} vectors of {EMBEDDING_DIM}")
+
+async def main():
+    await check_retry_after()
+    await check_unavailable()
+    await check_not_retried()
+    await check_concurrency()
+    await check_stream_and_embed()
+    print("all LLM client checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
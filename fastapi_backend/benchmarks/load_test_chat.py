@@ -0,0 +1,69 @@
+"""
+Load test for the chat data layer against a local mongod.
+
+Simulates concurrent chat traffic and reports turns/second for the async
+(Motor) layer, as /get_bot_response uses it (recent-history window read and
+one add_chat_turn per turn), next to the old sync layer called from the event
+loop (full history read and two message inserts), which serialises every
+round trip.
+
+Usage (from fastapi_backend/):
+    python benchmarks/load_test_chat.py --users 50 --turns 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_DB_NAME", "loadtest")
+
+import mongo_apis
+import mongo_apis_async
+from config import HISTORY_WINDOW
+
+
+async def chat_turn_async(session_id: str, turn: int):
+    await mongo_apis_async.retrieve_recent_history(session_id, HISTORY_WINDOW)
+    await mongo_apis_async.add_chat_turn(session_id, f"question {turn}", f"answer {turn}")
+
+async def chat_turn_sync(session_id: str, turn: int):
+    # What the handlers used to do: blocking pymongo calls inside a coroutine
+    mongo_apis.retrieve_history(session_id)
+    mongo_apis.add_message(session_id, "user", f"question {turn}")
+    mongo_apis.add_message(session_id, "assistant", f"answer {turn}")
+
+async def run(turn_fn, session_ids, turns):
+    async def user(session_id):
+        for turn in range(turns):
+            await turn_fn(session_id, turn)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(s) for s in session_ids))
+    elapsed = time.perf_counter() - start
+    return len(session_ids) * turns / elapsed, elapsed
+
+async def main(users: int, turns: int):
+    mongo_apis_async.init_mongo()
+    mongo_apis.db = mongo_apis.client[os.environ["MONGO_DB_NAME"]]
+    mongo_apis.message_collection = mongo_apis.db["messages"]
+    user_id = str(mongo_apis_async.ObjectId())
+    session_ids = [str(await mongo_apis_async.create_user_session(user_id)) for _ in range(users)]
+
+    try:
+        for name, fn in (("sync (blocking)", chat_turn_sync), ("async (motor)", chat_turn_async)):
+            throughput, elapsed = await run(fn, session_ids, turns)
+            print(f"{name:16s} {users} users x {turns} turns: {elapsed:6.2f}s  {throughput:8.1f} turns/s")
+    finally:
+        if mongo_apis_async.chat_write_buffer is not None:
+            await mongo_apis_async.chat_write_buffer.flush()
+        await mongo_apis_async.client.drop_database(os.environ["MONGO_DB_NAME"])
+        await mongo_apis_async.close_mongo()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.turns))
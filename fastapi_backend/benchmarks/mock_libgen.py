@@ -0,0 +1,124 @@
+"""
+Local stand-in for LibGen, serving the hand-made HTML fixtures in fixtures/.
+
+Routes:
+    /search.php              search results (fixtures/libgen_search.html)
+    /book/index.php?md5=...  book detail page with the mirror link
+    /mirror/<md5>            mirror page whose GET link points back at this server
+    /get/<md5>/<file name>   the book bytes (deterministic, `file_size` bytes), with
+                             single-range Range / If-Range support
+Every response waits `delay` seconds first, to stand in for a slow mirror.
+With `drop_after`, the first full download of a file stops after that many
+bytes and closes the connection, to exercise download resumption.
+
+Used by the LibGen benchmarks; can also be run alone:
+    python benchmarks/mock_libgen.py --port 8765 --delay 0.2
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class MockLibGen:
+    ETAG = '"mock-book-1"'
+
+    def __init__(self, delay: float = 0.0, file_size: int = 1024 * 1024, port: int = 0, drop_after: int | None = None):
+        self.delay = delay
+        self.content = random.Random(0).randbytes(file_size)
+        self.drop_after = drop_after
+        self.requests = 0
+        self.range_requests = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, body: bytes, content_type: str, headers=None, status=200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_file(self, filename: str):
+                headers = {"Content-Disposition": f'attachment; filename="{filename}"', "ETag": MockLibGen.ETAG,
+                           "Accept-Ranges": "bytes"}
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if range_header and (if_range is None or if_range == MockLibGen.ETAG):
+                    mock.range_requests += 1
+                    start = int(range_header.split("=")[1].split("-")[0])
+                    headers["Content-Range"] = f"bytes {start}-{len(mock.content) - 1}/{len(mock.content)}"
+                    self.send_body(mock.content[start:], "application/pdf", headers, status=206)
+                    return
+                if mock.drop_after is None:
+                    self.send_body(mock.content, "application/pdf", headers)
+                    return
+                # Announce the whole file, send part of it and hang up
+                drop_after, mock.drop_after = mock.drop_after, None
+                self.send_response(200)
+                self.send_header("Content-Type", "application/pdf")
+                self.send_header("Content-Length", str(len(mock.content)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(mock.content[:drop_after])
+                self.wfile.flush()
+                self.close_connection = True
+
+            def do_GET(self):
+                mock.requests += 1
+                time.sleep(mock.delay)
+                path = urlsplit(self.path).path
+                if path == "/search.php":
+                    self.send_body(read_fixture("libgen_search.html").encode(), "text/html; charset=utf-8")
+                elif path == "/book/index.php":
+                    self.send_body(read_fixture("libgen_detail.html").encode(), "text/html; charset=utf-8")
+                elif path.startswith("/mirror/"):
+                    md5 = path.rsplit("/", 1)[-1]
+                    html = read_fixture("libgen_mirror.html").replace("{download_url}", f"{mock.base_url}/get/{md5}/book.pdf")
+                    self.send_body(html.encode(), "text/html; charset=utf-8")
+                elif path.startswith("/get/"):
+                    self.send_file(path.rsplit("/", 1)[-1])
+                else:
+                    self.send_body(b"not found", "text/plain", status=404)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    with MockLibGen(args.delay, port=args.port) as mock:
+        print(f"Mock LibGen on {mock.base_url} (search: {mock.base_url}/search.php)")
+        threading.Event().wait()
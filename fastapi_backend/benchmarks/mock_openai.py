@@ -0,0 +1,128 @@
+"""
+Local stand-in for the OpenAI API, for the LLM client checks.
+
+Routes:
+    POST /v1/chat/completions   a fixed answer, streamed as SSE when "stream" is set
+    POST /v1/embeddings         deterministic vectors (float lists or base64)
+Every response waits `delay` seconds first. Failures are scripted: each entry of
+`failures` is (status, headers) and is answered, in order, before any success.
+The highest number of requests in flight at once is recorded, to check the
+client's concurrency caps.
+
+Can also be run alone:
+    python benchmarks/mock_openai.py --port 8766 --delay 0.2
+"""
+import argparse
+import base64
+import json
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "The answer is forty-two."
+EMBEDDING_DIM = 8
+
+
+class MockOpenAI:
+    def __init__(self, delay: float = 0.0, failures=None, port: int = 0):
+        self.delay = delay
+        self.failures = list(failures or [])
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status: int, payload: dict, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_stream(self, model: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in ANSWER.split(" "):
+                    chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                             "choices": [{"index": 0, "delta": {"content": token + " "}, "finish_reason": None}]}
+                    self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.write_chunk(b"data: [DONE]\n\n")
+                self.write_chunk(b"")
+
+            def write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with mock._lock:
+                    mock.requests += 1
+                    mock.in_flight += 1
+                    mock.max_in_flight = max(mock.max_in_flight, mock.in_flight)
+                    failure = mock.failures.pop(0) if mock.failures else None
+                try:
+                    time.sleep(mock.delay)
+                    if failure is not None:
+                        status, headers = failure
+                        self.send_json(status, {"error": {"message": f"mock error {status}", "type": "mock"}}, headers)
+                    elif self.path.endswith("/chat/completions"):
+                        if body.get("stream"):
+                            self.send_stream(body.get("model", ""))
+                        else:
+                            self.send_json(200, {
+                                "id": "chatcmpl-mock", "object": "chat.completion", "created": 0,
+                                "model": body.get("model", ""),
+                                "choices": [{"index": 0, "finish_reason": "stop",
+                                             "message": {"role": "assistant", "content": ANSWER}}],
+                            })
+                    elif self.path.endswith("/embeddings"):
+                        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                        data = []
+                        for i, text in enumerate(inputs):
+                            vector = [float((len(text) + i + d) % 7) for d in range(EMBEDDING_DIM)]
+                            if body.get("encoding_format") == "base64":
+                                vector = base64.b64encode(struct.pack(f"<{EMBEDDING_DIM}f", *vector)).decode()
+                            data.append({"object": "embedding", "index": i, "embedding": vector})
+                        self.send_json(200, {"object": "list", "data": data, "model": body.get("model", ""),
+                                             "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+                    else:
+                        self.send_json(404, {"error": {"message": "not found", "type": "mock"}})
+                finally:
+                    with mock._lock:
+                        mock.in_flight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    with MockOpenAI(args.delay, port=args.port) as mock:
+        print(f"Mock OpenAI on {mock.base_url} (set OPENAI_BASE_URL to it)")
+        threading.Event().wait()
@@ -0,0 +1,121 @@
+import asyncio
+import datetime
+import random
+import time
+
+
+class MessageCleanup:
+    """
+    Batched deletion of chat messages whose session is gone.
+
+    `purge_session` removes the messages of one deleted session, `batch_size`
+    documents at a time, yielding to the event loop between batches so a huge
+    session never stalls request handling. `collect_orphans` walks the distinct
+    session_ids of the messages collection through the (session_id, ...) index
+    and purges the ones whose session document no longer exists, which covers
+    sessions deleted before deletes cascaded.
+
+    Attributes:
+        messages: Motor collection holding chat messages.
+        sessions: Motor collection holding chat sessions.
+        batch_size: Documents deleted per delete_many.
+    """
+    def __init__(self, messages, sessions, batch_size: int):
+        self.messages = messages
+        self.sessions = sessions
+        self.batch_size = batch_size
+        self.deleted_messages = 0
+        self.delete_batches = 0
+        self.sessions_purged = 0
+        self.gc_runs = 0
+        self.gc_progress = None
+        self.last_gc = None
+
+    async def purge_session(self, session_id) -> int:
+        deleted = 0
+        while True:
+            batch = await self.messages.find(
+                {"session_id": session_id}, {"_id": 1}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                break
+            result = await self.messages.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+            deleted += result.deleted_count
+            self.deleted_messages += result.deleted_count
+            self.delete_batches += 1
+            await asyncio.sleep(0)
+        self.sessions_purged += 1
+        return deleted
+
+    async def _distinct_session_ids(self):
+        # Index-backed walk: one short lookup per distinct session_id, constant memory
+        last = None
+        while True:
+            query = {"session_id": {"$gt": last}} if last is not None else {}
+            doc = await self.messages.find_one(query, {"session_id": 1, "_id": 0}, sort=[("session_id", 1)])
+            if doc is None:
+                return
+            last = doc["session_id"]
+            yield last
+
+    async def collect_orphans(self) -> dict:
+        start = time.perf_counter()
+        progress = {
+            "started_at": datetime.datetime.now(datetime.timezone.utc),
+            "sessions_scanned": 0,
+            "orphaned_sessions": 0,
+            "deleted_messages": 0,
+        }
+        self.gc_progress = progress
+
+        async def purge_orphans(session_ids):
+            existing = {doc["_id"] async for doc in self.sessions.find({"_id": {"$in": session_ids}}, {"_id": 1})}
+            for session_id in session_ids:
+                if session_id not in existing:
+                    progress["orphaned_sessions"] += 1
+                    progress["deleted_messages"] += await self.purge_session(session_id)
+
+        try:
+            candidates = []
+            async for session_id in self._distinct_session_ids():
+                progress["sessions_scanned"] += 1
+                candidates.append(session_id)
+                if len(candidates) >= self.batch_size:
+                    await purge_orphans(candidates)
+                    candidates = []
+            if candidates:
+                await purge_orphans(candidates)
+        finally:
+            elapsed = time.perf_counter() - start
+            progress["finished_at"] = datetime.datetime.now(datetime.timezone.utc)
+            progress["duration_s"] = round(elapsed, 3)
+            progress["deleted_per_s"] = round(progress["deleted_messages"] / elapsed, 1) if elapsed else None
+            self.gc_progress = None
+            self.last_gc = progress
+            self.gc_runs += 1
+        print(f"[orphan-gc] scanned {progress['sessions_scanned']} sessions, "
+              f"purged {progress['deleted_messages']} messages from {progress['orphaned_sessions']} orphaned sessions "
+              f"in {progress['duration_s']}s")
+        return progress
+
+    async def run_periodic(self, interval: float):
+        # Nothing at startup: every worker runs this loop, and restarts would rescan at once.
+        # The jitter spreads the workers' runs over the interval.
+        while True:
+            await asyncio.sleep(interval * random.uniform(1.0, 1.5))
+            try:
+                await self.collect_orphans()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[orphan-gc] run failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "deleted_messages": self.deleted_messages,
+            "delete_batches": self.delete_batches,
+            "sessions_purged": self.sessions_purged,
+            "gc_runs": self.gc_runs,
+            "gc_in_progress": self.gc_progress,
+            "last_gc": self.last_gc,
+        }
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from cache_utils import TTLCache
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().casefold()
+
+
+class CompletionCache:
+    """
+    Two-tier cache of chat completions keyed on the model and the normalized
+    message history: an in-process TTL/LRU tier and an optional on-disk tier
+    (one JSON file per entry) that survives restarts and is shared by the
+    workers of one host.
+
+    Attributes:
+        memory: In-process TTLCache tier.
+        disk_dir: Directory of the on-disk tier, or None to disable it.
+        max_disk_entries: Number of files kept on disk before the oldest are pruned.
+    """
+    def __init__(self, max_entries: int, ttl: float, disk_dir: str | None = None, max_disk_entries: int = 10000):
+        self.memory = TTLCache(max_entries, ttl)
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.bypassed = 0
+        self._disk_writes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, messages: list) -> str:
+        normalized = [{"role": m["role"], "content": normalize_text(m["content"])} for m in messages]
+        payload = json.dumps({"model": model, "messages": normalized}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get(self, key: str):
+        response = self.memory.get(key)
+        if response is None and self.disk_dir:
+            response = await asyncio.to_thread(self._disk_get, key)
+            if response is not None:
+                self.disk_hits += 1
+                self.memory.set(key, response)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def set(self, key: str, response: str):
+        self.memory.set(key, response)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, response)
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str):
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+            return None
+        return entry["response"]
+
+    def _disk_set(self, key: str, response: str):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": time.time() + self.memory.ttl, "response": response}, f)
+        os.replace(tmp_path, path)
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        # Drop the least recently written files once the tier grows past its bound
+        entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".json")]
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "memory": self.memory.stats(),
+        }
@@ -0,0 +1,159 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+##### MONGODB ######
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "db")
+# Connection pool sizing for the async client, shared by every request handler
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+##### CHAT ######
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+# Number of most recent messages sent to the model with every question
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "7"))
+# Per-session in-process cache of recent messages (must be >= HISTORY_WINDOW to be useful)
+HISTORY_CACHE_MESSAGES = int(os.getenv("HISTORY_CACHE_MESSAGES", "20"))
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "10000"))
+
+##### CHAT PERSISTENCE ######
+# Write-behind mode buffers chat turns in memory and flushes them in batches
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "500"))
+CHAT_WRITE_FLUSH_INTERVAL_S = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL_S", "0.5"))
+
+##### PAGINATION ######
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+##### BACKGROUND JOBS ######
+TITLE_JOB_WORKERS = int(os.getenv("TITLE_JOB_WORKERS", "4"))
+
+##### COMPLETION CACHE ######
+COMPLETION_CACHE_SIZE = int(os.getenv("COMPLETION_CACHE_SIZE", "5000"))
+COMPLETION_CACHE_TTL_S = float(os.getenv("COMPLETION_CACHE_TTL_S", "86400"))
+# Set to a directory to enable the on-disk tier
+COMPLETION_CACHE_DIR = os.getenv("COMPLETION_CACHE_DIR") or None
+COMPLETION_CACHE_DISK_ENTRIES = int(os.getenv("COMPLETION_CACHE_DISK_ENTRIES", "100000"))
+
+##### OPENAI ######
+# Shared AsyncOpenAI client: connection pool, concurrency caps, timeouts and retries
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+OPENAI_PER_USER_CONCURRENCY = int(os.getenv("OPENAI_PER_USER_CONCURRENCY", "2"))
+OPENAI_CONNECT_TIMEOUT_S = float(os.getenv("OPENAI_CONNECT_TIMEOUT_S", "5"))
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BACKOFF_BASE_S = float(os.getenv("OPENAI_BACKOFF_BASE_S", "0.5"))
+OPENAI_BACKOFF_MAX_S = float(os.getenv("OPENAI_BACKOFF_MAX_S", "20"))
+# Session -> owner lookups for the per-user limit (owners never change)
+SESSION_OWNER_CACHE_SIZE = int(os.getenv("SESSION_OWNER_CACHE_SIZE", "10000"))
+
+##### CLEANUP ######
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "1000"))
+CLEANUP_JOB_WORKERS = int(os.getenv("CLEANUP_JOB_WORKERS", "2"))
+# Orphaned-message garbage collection period (first run one period after startup), 0 disables it
+ORPHAN_GC_INTERVAL_S = float(os.getenv("ORPHAN_GC_INTERVAL_S", "3600"))
+
+##### UPLOADS ######
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Bytes read from the request and sent to storage per step (GCS needs a multiple of 256 KiB)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 256 * 1024)))
+# An upload of content another upload is still writing waits for it, polling this often
+BLOB_CLAIM_POLL_S = float(os.getenv("BLOB_CLAIM_POLL_S", "0.5"))
+# A blob still pending after this long (its upload died) is written again by the next upload
+BLOB_CLAIM_STALE_S = float(os.getenv("BLOB_CLAIM_STALE_S", "600"))
+# ...and gives up (503) after waiting this long in total
+BLOB_CLAIM_WAIT_S = float(os.getenv("BLOB_CLAIM_WAIT_S", "120"))
+
+##### SIGNED URLS ######
+SIGNED_URL_TTL_S = int(os.getenv("SIGNED_URL_TTL_S", "3600"))
+# Cached URLs are handed out until this long before they expire
+SIGNED_URL_REFRESH_MARGIN_S = int(os.getenv("SIGNED_URL_REFRESH_MARGIN_S", "300"))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000"))
+
+##### GOOGLE CLOUD STORAGE ######
+GCS_CREDENTIALS_FILE = os.getenv("GCS_CREDENTIALS_FILE", "winter-agility-425909-q9-73e61deee040.json")
+GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "user-pdfs-for-digital-library")
+
+##### STORAGE BACKEND ######
+# "gcs" (signed URLs to the bucket) or "local" (files on disk served by /files/ with Range support)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "local_storage")
+# Signs /files/ links of the local backend; set it explicitly when running several workers
+LOCAL_STORAGE_SECRET = os.getenv("LOCAL_STORAGE_SECRET") or os.urandom(32).hex()
+# Externally reachable address of this API, used in local-backend links
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:5000")
+
+##### BOOK INGESTION ######
+# Text extraction runs in a process pool; PDFs are split into batches of pages per task
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", str(max(1, (os.cpu_count() or 2) - 1))))
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "25"))
+# A running index not updated for this long (its process died) can be built again
+INGEST_STALE_S = float(os.getenv("INGEST_STALE_S", "900"))
+
+##### BOOK RETRIEVAL ######
+# "openai" (embeddings API) or "hashing" (deterministic local embedder, no API calls)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Vector size of the hashing embedder
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Per-book vector matrices (memory-mapped) live here
+RETRIEVAL_INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", "retrieval_index")
+RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1500"))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+# Number of open book indexes kept in memory
+RETRIEVAL_OPEN_INDEXES = int(os.getenv("RETRIEVAL_OPEN_INDEXES", "64"))
+
+##### BULK UPLOADS ######
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "50"))
+# Files of one batch streamed to storage at the same time
+BULK_UPLOAD_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", "4"))
+
+##### PDF OPTIMIZATION ######
+# Store a linearized ("fast web view") copy of uploaded PDFs and link to it (needs pikepdf or qpdf).
+# Optional: it stores a second copy of every PDF that is not linearized already.
+PDF_LINEARIZE = os.getenv("PDF_LINEARIZE", "0") == "1"
+
+##### STORAGE QUOTAS ######
+# Per-user limits enforced on upload, 0 means unlimited
+USER_QUOTA_BYTES = int(os.getenv("USER_QUOTA_BYTES", "0"))
+USER_QUOTA_FILES = int(os.getenv("USER_QUOTA_FILES", "0"))
+USAGE_RECONCILE_BATCH_SIZE = int(os.getenv("USAGE_RECONCILE_BATCH_SIZE", "500"))
+
+##### LIBGEN HTTP CLIENT ######
+LIBGEN_CONNECT_TIMEOUT_S = float(os.getenv("LIBGEN_CONNECT_TIMEOUT_S", "5"))
+LIBGEN_READ_TIMEOUT_S = float(os.getenv("LIBGEN_READ_TIMEOUT_S", "30"))
+LIBGEN_MAX_CONNECTIONS = int(os.getenv("LIBGEN_MAX_CONNECTIONS", "20"))
+# Requests in flight to one mirror host
+LIBGEN_PER_HOST_CONCURRENCY = int(os.getenv("LIBGEN_PER_HOST_CONCURRENCY", "4"))
+# Used only when the h2 package is installed
+LIBGEN_HTTP2 = os.getenv("LIBGEN_HTTP2", "1") == "1"
+LIBGEN_SEARCH_URL = os.getenv("LIBGEN_SEARCH_URL", "https://libgen.is/search.php")
+
+##### LIBGEN SEARCH CACHE ######
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2000"))
+SEARCH_CACHE_TTL_S = float(os.getenv("SEARCH_CACHE_TTL_S", "900"))
+# After the TTL, results are still served (and refreshed in the background) this much longer
+SEARCH_CACHE_STALE_S = float(os.getenv("SEARCH_CACHE_STALE_S", "86400"))
+# HTML extraction backend for LibGen pages: auto, selectolax, lxml or bs4 (see html_extract.py)
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "auto")
+# Range-request resumes of a dropped book download
+LIBGEN_DOWNLOAD_RETRIES = int(os.getenv("LIBGEN_DOWNLOAD_RETRIES", "3"))
+
+##### LIBGEN IMPORTS ######
+# Imports run in the background (see /libgen-upload/), this many at a time per process
+LIBGEN_IMPORT_WORKERS = int(os.getenv("LIBGEN_IMPORT_WORKERS", "4"))
+# Download progress is written to the job document at most this often
+IMPORT_PROGRESS_INTERVAL_S = float(os.getenv("IMPORT_PROGRESS_INTERVAL_S", "0.5"))
+# An active job not updated for this long is considered dead and can be started again
+IMPORT_JOB_STALE_S = float(os.getenv("IMPORT_JOB_STALE_S", "1800"))
+# Poll interval of the progress event stream
+IMPORT_EVENTS_POLL_S = float(os.getenv("IMPORT_EVENTS_POLL_S", "0.5"))
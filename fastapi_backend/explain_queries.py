@@ -0,0 +1,81 @@
+"""
+Dev command: runs explain() on every query shape issued by mongo_apis and
+flags the ones whose winning plan contains a COLLSCAN.
+
+Usage (from fastapi_backend/):
+    python explain_queries.py
+Exits with status 1 if any query scans a whole collection.
+"""
+import datetime
+import sys
+from bson import ObjectId
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from config import MONGO_URI, MONGO_DB_NAME
+
+_id = ObjectId()
+_now = datetime.datetime.now(datetime.timezone.utc)
+
+# (description, collection, filter, sort). Updates and deletes are explained
+# through the equivalent find, which goes through the same plan selection.
+QUERIES = [
+    ("retrieve_user_id", "users", {"name": "n", "email": "e"}, None),
+    ("update_session_title / update_session_last_active / delete_user_session", "sessions", {"_id": _id}, None),
+    ("retrieve_all_sessions", "sessions", {"user_id": _id},
+     [("last_active", DESCENDING), ("_id", DESCENDING)]),
+    ("retrieve_all_sessions (next page)", "sessions",
+     {"user_id": _id, "$or": [{"last_active": {"$lt": _now}}, {"last_active": _now, "_id": {"$lt": _id}}]},
+     [("last_active", DESCENDING), ("_id", DESCENDING)]),
+    ("retrieve_history", "messages", {"session_id": _id}, [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+    ("retrieve_history (next page)", "messages",
+     {"session_id": _id, "$or": [{"timestamp": {"$gt": _now}}, {"timestamp": _now, "_id": {"$gt": _id}}]},
+     [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+    ("retrieve_recent_history", "messages", {"session_id": _id}, [("timestamp", DESCENDING)]),
+    ("update_history (find)", "messages", {"_id": _id, "session_id": _id}, None),
+    ("update_history (delete_many)", "messages", {"session_id": _id, "timestamp": {"$gte": _now}}, None),
+    ("delete_mongodb_file / find_user_file", "uploaded_files", {"_id": _id, "user_id": _id}, None),
+    ("get_file_detail", "uploaded_files", {"_id": _id}, None),
+    ("list_file_ids_by_user", "uploaded_files", {"user_id": _id},
+     [("upload_date", ASCENDING), ("_id", ASCENDING)]),
+    ("find_user_file_by_name", "uploaded_files", {"user_id": _id, "file_name": "f.pdf"}, None),
+    ("find_user_file_names", "uploaded_files", {"user_id": _id, "file_name": {"$in": ["a.pdf", "b.epub"]}}, None),
+    ("find_user_file_by_sha256", "uploaded_files", {"user_id": _id, "sha256": "0" * 64}, None),
+    ("purge_session_messages", "messages", {"session_id": _id}, None),
+    ("collect_orphans (distinct session_id walk, first)", "messages", {}, [("session_id", ASCENDING)]),
+    ("collect_orphans (distinct session_id walk, next)", "messages", {"session_id": {"$gt": _id}},
+     [("session_id", ASCENDING)]),
+    ("collect_orphans (existing sessions)", "sessions", {"_id": {"$in": [_id]}}, None),
+    ("reference_existing_blob (by source URL)", "blobs",
+     {"ref_count": {"$gte": 1}, "state": {"$ne": "pending"}, "sources.url": "https://libgen.is/book/index.php"}, None),
+    ("create_import_job (active job of the user for a URL)", "import_jobs",
+     {"user_id": _id, "book_detail_url": "https://libgen.is/book/index.php", "active": True}, None),
+    ("get_import_job", "import_jobs", {"_id": _id, "user_id": _id}, None),
+    ("reconcile_usage (file owner walk)", "uploaded_files", {"user_id": {"$gt": _id}}, [("user_id", ASCENDING)]),
+    ("reconcile_usage (counted users)", "user_usage", {"_id": {"$gt": _id}}, [("_id", ASCENDING)]),
+    ("reconcile_usage (sum files)", "uploaded_files", {"user_id": {"$in": [_id]}}, None),
+]
+
+def plan_stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+def main():
+    db = MongoClient(MONGO_URI)[MONGO_DB_NAME]
+    collscans = 0
+    for description, collection, query, sort in QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = [s for s in plan_stages(winning_plan) if s]
+        flag = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        collscans += flag == "COLLSCAN"
+        print(f"[{flag:8s}] {collection:15s} {description}: {' <- '.join(stages)}")
+    return 1 if collscans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+from collections import OrderedDict, deque
+
+
+class SessionHistoryCache:
+    """
+    Bounded LRU cache of the most recent messages of each chat session.
+
+    Each entry holds the last `max_messages` messages of a session in the same
+    shape retrieve_history returns ({sender: message, "id": id}). Entries are
+    appended to on every new message and dropped whenever history is edited or
+    the session is deleted, so a hit is always the true tail of the session.
+
+    Attributes:
+        max_sessions: Number of sessions kept before the least recently used is evicted.
+        max_messages: Number of trailing messages kept per session.
+    """
+    def __init__(self, max_sessions: int, max_messages: int):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._entries = OrderedDict()
+        # Sessions with a database read in flight -> write generation, so a read that
+        # raced with a new message or an edit cannot install a stale tail
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def begin_fill(self, session_id: str) -> int:
+        return self._pending.setdefault(session_id, 0)
+
+    def get(self, session_id: str, limit: int):
+        """Returns the last `limit` messages, or None if they cannot be served from cache."""
+        entry = self._entries.get(session_id)
+        if entry is None or limit > self.max_messages:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return list(entry)[-limit:] if limit else []
+
+    def fill(self, session_id: str, messages: list, generation: int):
+        """Installs the session tail read from the database, unless it changed meanwhile."""
+        if self._pending.pop(session_id, None) != generation:
+            return
+        self._entries[session_id] = deque(messages[-self.max_messages:], maxlen=self.max_messages)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def _mark_written(self, session_id: str):
+        if session_id in self._pending:
+            self._pending[session_id] += 1
+
+    def append(self, session_id: str, message: dict):
+        self._mark_written(session_id)
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            entry.append(message)
+
+    def invalidate(self, session_id: str):
+        self._mark_written(session_id)
+        self._entries.pop(session_id, None)
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,147 @@
+"""
+Pluggable extraction of the three things the API reads from LibGen pages:
+the search results table, the "Libgen & IPFS & Tor" mirror link of a detail
+page and the GET link inside #download of a mirror page.
+
+Backends return identical results (benchmarks/bench_html_extract.py checks it):
+  - "bs4": BeautifulSoup with html.parser (the original helpers in utility_functions)
+  - "lxml": lxml.html with targeted XPath, no soup tree
+  - "selectolax": selectolax (lexbor) CSS selectors, the fastest
+"auto" picks the fastest one installed. lxml and selectolax are optional.
+"""
+from urllib.parse import urljoin
+
+LIBGEN_BOOK_BASE = "https://libgen.is/"
+MIRROR_LINK_TEXT = "Libgen & IPFS & Tor"
+
+
+class BS4Extractor:
+    name = "bs4"
+
+    def __init__(self):
+        # Imported on use: bs4 (and requests, through utility_functions) stay off the startup path
+        import utility_functions
+        self._helpers = utility_functions
+
+    def search_results(self, html: str):
+        return self._helpers.parse_libgen_search(html)
+
+    def mirror_link(self, html: str, book_detail_url: str) -> str:
+        return self._helpers.parse_mirror_link(html, book_detail_url)
+
+    def download_link(self, html: str) -> str:
+        return self._helpers.parse_download_link(html)
+
+
+class LxmlExtractor:
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        self._parse = lxml.html.fromstring
+
+    @staticmethod
+    def _string(element):
+        # Same as BeautifulSoup's .string: the text of an element with a single text child
+        children = list(element)
+        if not children:
+            return element.text
+        if len(children) > 1 or element.text or children[0].tail:
+            return None
+        return LxmlExtractor._string(children[0])
+
+    def search_results(self, html: str):
+        tables = self._parse(html).xpath('//table[contains(concat(" ", normalize-space(@class), " "), " c ")]')
+        books = []
+        if not tables:
+            return books
+        for row in tables[0].xpath('.//tr')[1:]:  # Skip the header row
+            columns = row.xpath('.//td')
+            if len(columns) > 2:
+                links = columns[2].xpath('.//a')
+                if links and links[0].get('href') is not None:
+                    title = " ".join(t.strip() for t in links[0].itertext() if t.strip())
+                    books.append({'title': title, 'link': LIBGEN_BOOK_BASE + links[0].get('href')})
+        return books
+
+    def mirror_link(self, html: str, book_detail_url: str) -> str:
+        for link in self._parse(html).iter('a'):
+            text = self._string(link)
+            if text and MIRROR_LINK_TEXT in text:
+                return urljoin(book_detail_url, link.get('href'))
+        raise ValueError("Mirror link 'Libgen & IPFS & Tor' not found.")
+
+    def download_link(self, html: str) -> str:
+        divs = self._parse(html).xpath('//div[@id="download"]')
+        if not divs:
+            raise ValueError("<div id='download'> not found in mirror page.")
+        for link in divs[0].iter('a'):
+            if self._string(link) == "GET":
+                return link.get('href')
+        raise ValueError("GET download link not found.")
+
+
+class SelectolaxExtractor:
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parse = LexborHTMLParser
+
+    @staticmethod
+    def _string(node):
+        # Same as BeautifulSoup's .string: the text of an element with a single text child
+        children = list(node.iter(include_text=True))
+        if len(children) != 1:
+            return None
+        child = children[0]
+        if child.tag == "-text":
+            return child.text_content
+        return SelectolaxExtractor._string(child)
+
+    def search_results(self, html: str):
+        table = self._parse(html).css_first('table.c')
+        books = []
+        if table is None:
+            return books
+        for row in table.css('tr')[1:]:  # Skip the header row
+            columns = row.css('td')
+            if len(columns) > 2:
+                link = columns[2].css_first('a')
+                if link is not None and 'href' in link.attributes:
+                    texts = (node.text_content.strip() for node in link.traverse(include_text=True) if node.tag == "-text")
+                    title = " ".join(t for t in texts if t)
+                    books.append({'title': title, 'link': LIBGEN_BOOK_BASE + (link.attributes['href'] or "")})
+        return books
+
+    def mirror_link(self, html: str, book_detail_url: str) -> str:
+        for link in self._parse(html).css('a'):
+            text = self._string(link)
+            if text and MIRROR_LINK_TEXT in text:
+                return urljoin(book_detail_url, link.attributes.get('href'))
+        raise ValueError("Mirror link 'Libgen & IPFS & Tor' not found.")
+
+    def download_link(self, html: str) -> str:
+        div = self._parse(html).css_first('div#download')
+        if div is None:
+            raise ValueError("<div id='download'> not found in mirror page.")
+        for link in div.css('a'):
+            if self._string(link) == "GET":
+                return link.attributes.get('href')
+        raise ValueError("GET download link not found.")
+
+
+BACKENDS = {"selectolax": SelectolaxExtractor, "lxml": LxmlExtractor, "bs4": BS4Extractor}
+
+
+def get_extractor(name: str = "auto"):
+    """Extractor for a backend name, or the fastest installed one for "auto"."""
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown HTML_PARSER_BACKEND {name!r}, expected one of {', '.join(BACKENDS)} or 'auto'.")
+        return BACKENDS[name]()
+    for backend in BACKENDS.values():
+        try:
+            return backend()
+        except ImportError:
+            continue
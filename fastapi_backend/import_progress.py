@@ -0,0 +1,48 @@
+import time
+from mongo_apis_async import update_import_job, finish_import_job
+
+
+class ImportProgress:
+    """
+    Reports the progress of one LibGen import to its import_jobs document.
+
+    State changes are written at once; byte counts of the download, which change
+    with every chunk, at most every `min_interval` seconds.
+    """
+    def __init__(self, job_id, min_interval: float):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last_write = 0.0
+
+    async def state(self, state: str, **fields):
+        await update_import_job(self.job_id, {"state": state, **fields})
+
+    async def downloaded(self, received: int, total: int | None):
+        now = time.monotonic()
+        if now - self._last_write < self.min_interval:
+            return
+        self._last_write = now
+        await update_import_job(self.job_id, {"bytes_downloaded": received, "bytes_total": total})
+
+    async def done(self, received: int, result: dict):
+        await finish_import_job(self.job_id, "done", {"bytes_downloaded": received, "result": result})
+
+    async def failed(self, error: str, status_code: int):
+        await finish_import_job(self.job_id, "failed", {"error": error, "status_code": status_code})
+
+
+def import_job_view(job: dict) -> dict:
+    """JSON-friendly job document for the API."""
+    return {
+        "job_id": str(job["_id"]),
+        "book_detail_url": job["book_detail_url"],
+        "state": job["state"],
+        "bytes_downloaded": job["bytes_downloaded"],
+        "bytes_total": job["bytes_total"],
+        "result": job["result"],
+        "error": job["error"],
+        "status_code": job["status_code"],
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat(),
+        "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None,
+    }
@@ -0,0 +1,118 @@
+"""
+Index declarations for every collection used by mongo_apis / mongo_apis_async.
+
+The API creates them on startup (create_index is a no-op when the index
+already exists). Each index is created on its own, so one that cannot be
+built (e.g. user_file_name over legacy duplicate names) does not keep the
+others from being created. They can also be applied as a one-off migration,
+which first lists the duplicate file names blocking the unique index:
+    python indexes.py
+"""
+import sys
+
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from config import MONGO_URI, MONGO_DB_NAME
+
+# collection -> list of (keys, options)
+INDEXES = {
+    "messages": [
+        # retrieve_history (keyset on timestamp, _id) / retrieve_recent_history / update_history
+        ([("session_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+         {"name": "session_timestamp_id"}),
+    ],
+    "sessions": [
+        # retrieve_all_sessions (keyset on last_active, _id)
+        ([("user_id", ASCENDING), ("last_active", DESCENDING), ("_id", DESCENDING)],
+         {"name": "user_last_active_id"}),
+    ],
+    "uploaded_files": [
+        # Duplicate-filename check on upload; the unique constraint makes it atomic.
+        # Also serves list_file_ids_by_user through its user_id prefix.
+        ([("user_id", ASCENDING), ("file_name", ASCENDING)], {"name": "user_file_name", "unique": True}),
+        # list_file_ids_by_user (keyset on upload_date, _id)
+        ([("user_id", ASCENDING), ("upload_date", ASCENDING), ("_id", ASCENDING)],
+         {"name": "user_upload_date_id"}),
+        # reconcile_usage groups by user through the user_id prefix of the indexes above
+    ],
+    "blobs": [
+        # reference_existing_blob by source URL (LibGen re-imports)
+        ([("sources.url", ASCENDING)], {"name": "source_url"}),
+    ],
+    "import_jobs": [
+        # One active import of a book URL per user: a second request finds the running job
+        ([("user_id", ASCENDING), ("book_detail_url", ASCENDING)],
+         {"name": "active_user_url", "unique": True, "partialFilterExpression": {"active": True}}),
+        # Finished jobs are kept a week for polling, then removed
+        ([("finished_at", ASCENDING)], {"name": "finished_ttl", "expireAfterSeconds": 7 * 24 * 3600}),
+    ],
+    "users": [
+        # retrieve_user_id
+        ([("name", ASCENDING), ("email", ASCENDING)], {"name": "name_email"}),
+    ],
+}
+
+# Indexes superseded by the ones above (prefixes of a wider index), dropped if present
+OBSOLETE_INDEXES = {
+    "messages": ["session_timestamp"],
+    "sessions": ["user_last_active"],
+}
+
+async def ensure_indexes(db):
+    """Creates every index, returns [(collection, index name, error)] for those that failed."""
+    failures = []
+    for collection_name, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                await db[collection_name].create_index(keys, **options)
+            except Exception as e:
+                failures.append((collection_name, options["name"], e))
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection_name].drop_index(name)
+    return failures
+
+def ensure_indexes_sync(db):
+    failures = []
+    for collection_name, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection_name].create_index(keys, **options)
+                print(f"{collection_name}: {options['name']} ok")
+            except Exception as e:
+                failures.append((collection_name, options["name"], e))
+                print(f"{collection_name}: {options['name']} FAILED: {e}")
+    for collection_name, names in OBSOLETE_INDEXES.items():
+        existing = db[collection_name].index_information()
+        for name in names:
+            if name in existing:
+                db[collection_name].drop_index(name)
+                print(f"{collection_name}: {name} dropped")
+    return failures
+
+def find_duplicate_file_names(db):
+    """(user_id, file_name) pairs held by more than one uploaded file; they block the user_file_name index."""
+    return list(db["uploaded_files"].aggregate([
+        {"$group": {"_id": {"user_id": "$user_id", "file_name": "$file_name"},
+                    "count": {"$sum": 1}, "file_ids": {"$push": "$_id"}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"_id.user_id": 1, "_id.file_name": 1}},
+    ], allowDiskUse=True))
+
+def report_duplicate_file_names(db):
+    duplicates = find_duplicate_file_names(db)
+    for duplicate in duplicates:
+        ids = ", ".join(str(file_id) for file_id in duplicate["file_ids"])
+        print(f"uploaded_files: user {duplicate['_id']['user_id']} has {duplicate['count']} files named "
+              f"{duplicate['_id']['file_name']!r} ({ids})")
+    if duplicates:
+        print(f"uploaded_files: {len(duplicates)} duplicate names; rename or delete all but one of each "
+              f"before user_file_name can be built")
+    return duplicates
+
+if __name__ == "__main__":
+    database = MongoClient(MONGO_URI)[MONGO_DB_NAME]
+    report_duplicate_file_names(database)
+    if ensure_indexes_sync(database):
+        sys.exit(1)
@@ -0,0 +1,211 @@
+"""
+Background text extraction for uploaded books.
+
+After an upload, ingest_book extracts the text of every PDF page (or EPUB
+chapter) in a process pool and stores a compact page index:
+  - the UTF-8 text of all pages, concatenated, at page_index/<key>.txt in the storage backend
+  - a page_index document with the byte and character offsets of every page
+The index key is the content hash, so a book uploaded by many users is
+extracted once. Fetching any page range is one offset lookup and one ranged
+read (get_page_range), without re-parsing the book.
+"""
+import asyncio
+import io
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import unquote
+from config import INGEST_PROCESSES, INGEST_PAGES_PER_TASK, INGEST_STALE_S
+from mongo_apis_async import (start_page_index, update_page_index_progress, finish_page_index,
+                              fail_page_index, get_page_index, delete_page_index)
+from storage import get_storage
+from library import file_blob_path
+
+INDEX_PREFIX = "page_index/"
+
+_pool = None
+
+
+def get_process_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=INGEST_PROCESSES)
+    return _pool
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def index_key(file_doc: dict) -> str:
+    # Content hash when known; files stored before content addressing are indexed per file
+    return file_doc.get("sha256") or f"file-{file_doc['_id']}"
+
+def index_text_path(key: str) -> str:
+    return f"{INDEX_PREFIX}{key}.txt"
+
+
+##### EXTRACTION (runs in worker processes) ######
+def pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+def extract_pdf_pages(path: str, start: int, end: int) -> list[str]:
+    # pypdf is an optional dependency, only needed by ingestion workers
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+class _HTMLText(HTMLParser):
+    BLOCK_TAGS = {"p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "section", "blockquote"}
+    SKIP_TAGS = {"script", "style", "head"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+def html_to_text(html: str) -> str:
+    parser = _HTMLText()
+    parser.feed(html)
+    lines = (" ".join(line.split()) for line in "".join(parser.parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+def extract_epub_chapters(path: str) -> list[str]:
+    """Text of every document in the EPUB spine, in reading order."""
+    container_ns = {"c": "urn:oasis:names:tc:opendocument:xmlns:container"}
+    opf_ns = {"opf": "http://www.idpf.org/2007/opf"}
+    with zipfile.ZipFile(path) as epub:
+        container = ET.fromstring(epub.read("META-INF/container.xml"))
+        opf_path = container.find(".//c:rootfile", container_ns).get("full-path")
+        opf = ET.fromstring(epub.read(opf_path))
+        manifest = {item.get("id"): item.get("href") for item in opf.findall(".//opf:manifest/opf:item", opf_ns)}
+        base = posixpath.dirname(opf_path)
+        chapters = []
+        for itemref in opf.findall(".//opf:spine/opf:itemref", opf_ns):
+            href = manifest.get(itemref.get("idref"))
+            if not href:
+                continue
+            name = posixpath.normpath(posixpath.join(base, unquote(href.split("#")[0])))
+            try:
+                html = epub.read(name).decode("utf-8", errors="replace")
+            except KeyError:
+                continue
+            chapters.append(html_to_text(html))
+    return chapters
+
+
+##### PIPELINE ######
+async def _extract_pages(local_path: str, file_format: str, on_progress):
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    if file_format == "epub":
+        chapters = await loop.run_in_executor(pool, extract_epub_chapters, local_path)
+        await on_progress(len(chapters), len(chapters))
+        return chapters
+
+    total = await loop.run_in_executor(pool, pdf_page_count, local_path)
+    await on_progress(0, total)
+    batches = [(start, min(start + INGEST_PAGES_PER_TASK, total)) for start in range(0, total, INGEST_PAGES_PER_TASK)]
+
+    async def run_batch(start, end):
+        return start, await loop.run_in_executor(pool, extract_pdf_pages, local_path, start, end)
+
+    results = {}
+    done_pages = 0
+    for next_batch in asyncio.as_completed([run_batch(start, end) for start, end in batches]):
+        start, pages = await next_batch
+        results[start] = pages
+        done_pages += len(pages)
+        await on_progress(done_pages, total)
+    return [page for start, _ in batches for page in results[start]]
+
+async def ingest_book(file_doc: dict):
+    """Builds the page index of a stored book unless it already exists or is being built."""
+    key = index_key(file_doc)
+    if not await start_page_index(key, INGEST_STALE_S):
+        return
+    try:
+        async def on_progress(done, total):
+            await update_page_index_progress(key, done, total)
+
+        storage = get_storage()
+        async with storage.local_copy(file_blob_path(file_doc)) as local_path:
+            pages = await _extract_pages(local_path, file_doc["format"], on_progress)
+
+        byte_offsets, char_offsets = [0], [0]
+        encoded = []
+        for page in pages:
+            data = page.encode("utf-8")
+            encoded.append(data)
+            byte_offsets.append(byte_offsets[-1] + len(data))
+            char_offsets.append(char_offsets[-1] + len(page))
+        text_path = index_text_path(key)
+        await storage.upload_file_object(text_path, io.BytesIO(b"".join(encoded)), "text/plain; charset=utf-8")
+        await finish_page_index(key, text_path, byte_offsets, char_offsets)
+    except Exception as e:
+        await fail_page_index(key, str(e))
+        raise
+    except BaseException:
+        # Cancelled on shutdown: leave the index claimable instead of running forever
+        await fail_page_index(key, "Indexing interrupted.")
+        raise
+
+async def index_status(file_doc: dict):
+    index = await get_page_index(index_key(file_doc), with_offsets=False)
+    if index is None:
+        return {"status": "missing"}
+    return {
+        "status": index["status"],
+        "pages_done": index.get("pages_done"),
+        "pages_total": index.get("pages_total"),
+        "error": index.get("error"),
+    }
+
+async def get_page_range(file_doc: dict, first: int, last: int):
+    """
+    Text of pages first..last (0-based, inclusive) as [{"page", "char_start", "char_end", "text"}].
+    Returns None if the book has no finished index yet.
+    """
+    index = await get_page_index(index_key(file_doc))
+    if index is None or index["status"] != "done":
+        return None
+    byte_offsets, char_offsets = index["byte_offsets"], index["char_offsets"]
+    first = max(first, 0)
+    last = min(last, len(byte_offsets) - 2)
+    if last < first:
+        return []
+    data = await get_storage().read_range(index["text_path"], byte_offsets[first], byte_offsets[last + 1])
+    pages = []
+    for page in range(first, last + 1):
+        start, end = byte_offsets[page] - byte_offsets[first], byte_offsets[page + 1] - byte_offsets[first]
+        pages.append({
+            "page": page,
+            "char_start": char_offsets[page],
+            "char_end": char_offsets[page + 1],
+            "text": data[start:end].decode("utf-8"),
+        })
+    return pages
+
+async def remove_page_index(key: str):
+    index = await delete_page_index(key)
+    if index is not None and index.get("text_path"):
+        await get_storage().delete(index["text_path"])
@@ -0,0 +1,109 @@
+import asyncio
+import datetime
+import uuid
+from collections import OrderedDict
+
+# Every runner created in the process, so job status can be looked up by id alone
+_runners = []
+
+
+class JobRunner:
+    """
+    Bounded pool of asyncio workers for background jobs.
+
+    Jobs are deduplicated on a key: submitting a key that is already queued or
+    running returns the existing job instead of starting another one. Finished
+    jobs are kept (up to `max_finished`) so their status can still be polled.
+
+    Attributes:
+        name: Label used in logs and metrics.
+        workers: Maximum number of jobs running at the same time.
+        max_finished: Number of finished jobs whose status is retained.
+    """
+    def __init__(self, name: str, workers: int, max_finished: int = 1000):
+        self.name = name
+        self.workers = workers
+        self.max_finished = max_finished
+        self._queue = asyncio.Queue()
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._finished = 0
+        self._failed = 0
+        self._tasks = []
+        _runners.append(self)
+
+    def submit(self, key: str, fn, *args) -> dict:
+        """Queues `await fn(*args)` unless a job with the same key is in flight."""
+        if key in self._inflight:
+            return self.view(self._jobs[self._inflight[key]])
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "key": key,
+            "status": "queued",
+            "error": None,
+            "created_at": datetime.datetime.now(datetime.timezone.utc),
+            "finished_at": None,
+        }
+        self._jobs[job["job_id"]] = job
+        self._inflight[key] = job["job_id"]
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._queue.put_nowait((job, fn, args))
+        return self.view(job)
+
+    async def _worker(self):
+        while True:
+            job, fn, args = await self._queue.get()
+            job["status"] = "running"
+            try:
+                await fn(*args)
+                job["status"] = "done"
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                self._failed += 1
+                print(f"[{self.name}] job {job['key']} failed: {e}")
+            finally:
+                job["finished_at"] = datetime.datetime.now(datetime.timezone.utc)
+                self._inflight.pop(job["key"], None)
+                self._finished += 1
+                self._prune()
+                self._queue.task_done()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        return self.view(job) if job else None
+
+    @staticmethod
+    def view(job: dict) -> dict:
+        return dict(job)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "in_flight": len(self._inflight),
+            "finished": self._finished,
+            "failed": self._failed,
+        }
+
+
+def find_job(job_id: str):
+    for runner in _runners:
+        job = runner.get(job_id)
+        if job is not None:
+            return job
+    return None
+
+async def close_all_runners():
+    await asyncio.gather(*(runner.close() for runner in _runners))
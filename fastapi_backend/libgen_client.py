@@ -0,0 +1,228 @@
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx
+from starlette.concurrency import run_in_threadpool
+from html_extract import get_extractor
+from storage import FileTooLargeError
+
+
+def libgen_search_params(book_name: str, num: int) -> dict:
+    return {
+        "req": book_name,
+        "open": "0",
+        "res": num,
+        "view": "simple",
+        "phrase": "1",
+        "column": "def"
+    }
+
+def download_filename(headers, direct_download_url: str) -> str:
+    # Try to extract a filename from headers
+    content_disposition = headers.get('content-disposition')
+    filename = None
+    if content_disposition:
+        parts = content_disposition.split(';')
+        for part in parts:
+            if 'filename=' in part:
+                filename = part.split('=')[1].strip('"')
+                break
+
+    if not filename:
+        # If no filename found, fallback
+        filename = direct_download_url.split('/')[-1]
+    return filename
+
+
+class StreamingDownload:
+    """
+    A book download read chunk by chunk (`await read(n)`, b"" at the end), as
+    storage uploads consume it. At most one network chunk is buffered beyond
+    what the reader asked for. When the connection drops, or the body ends
+    short of its Content-Length, the download resumes from the bytes already
+    received with an HTTP Range request (If-Range guards against the file
+    changing in between), up to `retries` times.
+
+    Attributes:
+        filename: From Content-Disposition, or the last segment of the URL.
+        size: Content-Length of the file, if the server sent one.
+        received: Bytes read so far.
+    """
+    def __init__(self, client: httpx.AsyncClient, url: str, max_bytes: int, retries: int):
+        self.client = client
+        self.url = url
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.filename = None
+        self.size = None
+        self.received = 0
+        self.resumes = 0
+        self._response = None
+        self._chunks = None
+        self._buffer = bytearray()
+        self._validator = None
+
+    async def _send(self, headers: dict) -> httpx.Response:
+        # Identity encoding: Range offsets must count the bytes of the file itself
+        request = self.client.build_request("GET", self.url, headers={"Accept-Encoding": "identity", **headers})
+        response = await self.client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPError:
+            await response.aclose()
+            raise
+        return response
+
+    async def open(self):
+        self._response = await self._send({})
+        headers = self._response.headers
+        self.filename = download_filename(headers, self.url)
+        if headers.get("content-length", "").isdigit():
+            self.size = int(headers["content-length"])
+            # Refuse oversized files before transferring them
+            if self.size > self.max_bytes:
+                raise FileTooLargeError(f"File exceeds the maximum size of {self.max_bytes} bytes.")
+        self._validator = headers.get("etag") or headers.get("last-modified")
+        self._chunks = self._response.aiter_raw()
+
+    async def _resume(self, error: Exception):
+        if self.resumes >= self.retries or self.size is None:
+            raise error
+        self.resumes += 1
+        await self._response.aclose()
+        headers = {"Range": f"bytes={self.received}-"}
+        if self._validator:
+            headers["If-Range"] = self._validator
+        self._response = await self._send(headers)
+        content_range = self._response.headers.get("content-range", "")
+        if self._response.status_code != 206 or not content_range.startswith(f"bytes {self.received}-"):
+            # Range ignored or the file changed: the bytes already stored cannot be rewound
+            raise error
+        self._chunks = self._response.aiter_raw()
+
+    async def read(self, n: int) -> bytes:
+        while len(self._buffer) < n and self._chunks is not None:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                if self.size is not None and self.received < self.size:
+                    await self._resume(httpx.RemoteProtocolError(
+                        f"Download ended after {self.received} of {self.size} bytes."))
+                    continue
+                self._chunks = None
+                break
+            except httpx.TransportError as e:
+                await self._resume(e)
+                continue
+            self.received += len(chunk)
+            self._buffer += chunk
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    async def close(self):
+        if self._response is not None:
+            await self._response.aclose()
+
+
+class LibGenClient:
+    """
+    Async LibGen client shared by the API handlers.
+
+    One pooled httpx.AsyncClient (keep-alive, HTTP/2 when the h2 package is
+    installed) is reused for every request, with connect and read timeouts.
+    Requests to one host are capped by a per-host semaphore so a single slow
+    mirror cannot take every connection. HTML extraction (html_extract.py)
+    runs in the threadpool.
+
+    Attributes:
+        search_url: LibGen search endpoint.
+        per_host_concurrency: Requests in flight to one host.
+        extractor: HTML extraction backend.
+    """
+    def __init__(self, search_url: str, max_connections: int, per_host_concurrency: int,
+                 connect_timeout: float, read_timeout: float, http2: bool = True, parser_backend: str = "auto",
+                 download_retries: int = 3):
+        self.search_url = search_url
+        self.download_retries = download_retries
+        self.extractor = get_extractor(parser_backend)
+        self.max_connections = max_connections
+        self.per_host_concurrency = per_host_concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+        self._client = None
+        self._hosts = {}
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            try:
+                import h2  # noqa: F401  (httpx needs it for HTTP/2)
+                http2 = self.http2
+            except ImportError:
+                http2 = False
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        host = urlsplit(url).netloc
+        slot = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+        async with slot:
+            yield
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        async with self._host_slot(url):
+            self.requests += 1
+            try:
+                response = await self.client.get(url, **kwargs)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                self.errors += 1
+                raise
+        return response
+
+    async def search(self, book_name: str, num: int):
+        """Async fetch_libgen_books: [{'title', 'link'}]."""
+        response = await self.get(self.search_url, params=libgen_search_params(book_name, num))
+        return await run_in_threadpool(self.extractor.search_results, response.text)
+
+    async def resolve_download_url(self, book_detail_url: str) -> str:
+        """Follows the book detail page and its mirror page to the direct download URL."""
+        response = await self.get(book_detail_url)
+        mirror_url = await run_in_threadpool(self.extractor.mirror_link, response.text, book_detail_url)
+        mirror_response = await self.get(mirror_url)
+        return await run_in_threadpool(self.extractor.download_link, mirror_response.text)
+
+    @asynccontextmanager
+    async def open_download(self, url: str, max_bytes: int):
+        """Yields an opened StreamingDownload of `url`; holds a slot of its host until closed."""
+        async with self._host_slot(url):
+            self.requests += 1
+            download = StreamingDownload(self.client, url, max_bytes, self.download_retries)
+            try:
+                await download.open()
+                yield download
+            except httpx.HTTPError:
+                self.errors += 1
+                raise
+            finally:
+                await download.close()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "errors": self.errors, "hosts": len(self._hosts),
+                "parser": self.extractor.name}
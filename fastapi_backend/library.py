@@ -0,0 +1,96 @@
+"""
+Content-addressed book storage.
+
+Book bytes are stored once per distinct content, under blobs/<sha256> in the
+storage backend. Every uploaded_files document points at its blob, and the
+blobs collection keeps a reference count. The blob is deleted only when the
+last user file referencing it is removed. Files uploaded before content
+addressing keep their {user_id}/{file_name} path, which file_blob_path resolves.
+"""
+import asyncio
+import time
+import uuid
+from mongo_apis_async import (claim_blob, reference_existing_blob, set_blob_ready, abandon_blob_claim,
+                              release_blob_reference)
+from storage import get_storage
+from config import BLOB_CLAIM_STALE_S, BLOB_CLAIM_POLL_S, BLOB_CLAIM_WAIT_S
+
+CONTENT_PREFIX = "blobs/"
+UPLOAD_PREFIX = "uploads/"
+
+
+class BlobBusyError(Exception):
+    """Raised when the same content stays pending in another upload for longer than BLOB_CLAIM_WAIT_S."""
+
+
+def content_blob_path(sha256: str) -> str:
+    return f"{CONTENT_PREFIX}{sha256}"
+
+def file_blob_path(file_doc: dict) -> str:
+    return file_doc.get("blob_path") or f"{file_doc['user_id']}/{file_doc['file_name']}"
+
+async def store_upload(read_chunk, content_type: str, max_bytes: int, chunk_size: int, source=None):
+    """
+    Streams an upload into a temporary object, then takes a reference on its
+    content blob. New content is promoted to its content path; known content
+    just drops the temporary object. While another upload of the same content
+    is still promoting it, this one waits for it (or takes over if it fails).
+
+    Returns:
+        tuple: (blob path, size, sha256, whether the content was already stored).
+    """
+    storage = get_storage()
+    temp_path = f"{UPLOAD_PREFIX}{uuid.uuid4().hex}"
+    try:
+        size, sha256 = await storage.upload_stream(temp_path, read_chunk, content_type, max_bytes, chunk_size)
+        path = content_blob_path(sha256)
+        deadline = time.monotonic() + BLOB_CLAIM_WAIT_S
+        while True:
+            if await reference_existing_blob(sha256=sha256, source=source) is not None:
+                return path, size, sha256, True
+            if await claim_blob(sha256, size, path, source, BLOB_CLAIM_STALE_S):
+                break
+            if time.monotonic() >= deadline:
+                raise BlobBusyError("The same content is still being stored by another upload, please retry later.")
+            await asyncio.sleep(BLOB_CLAIM_POLL_S)
+        generation = None
+        try:
+            generation = await storage.promote(temp_path, path)
+            await set_blob_ready(sha256, generation)
+        except BaseException:
+            await abandon_blob_claim(sha256)
+            if generation is not None:
+                await storage.delete(path, generation)
+            raise
+        return path, size, sha256, False
+    finally:
+        await storage.delete(temp_path)
+
+async def reference_stored_content(sha256=None, source_url=None, source=None):
+    """Takes a reference on already stored content, or returns None if it is unknown."""
+    return await reference_existing_blob(sha256=sha256, source_url=source_url, source=source)
+
+async def release_content(sha256: str):
+    """Drops one reference; deletes the blob when it was the last one."""
+    blob_doc = await release_blob_reference(sha256)
+    if blob_doc is None:
+        return False
+    # The generation precondition keeps a concurrent re-upload of the same content alive.
+    # Without a generation the object was never recorded as written: leave it alone.
+    if blob_doc.get("generation") is not None:
+        await get_storage().delete(blob_doc["path"], blob_doc["generation"])
+    if blob_doc.get("optimized_path") and blob_doc["optimized_path"] != blob_doc["path"]:
+        await get_storage().delete(blob_doc["optimized_path"], blob_doc.get("optimized_generation"))
+    # Imported here: ingestion imports this module
+    from ingestion import remove_page_index
+    await remove_page_index(sha256)
+    return True
+
+async def release_file(file_doc: dict):
+    """Releases the storage behind a user file document (content-addressed or legacy)."""
+    if file_doc.get("sha256") and file_doc.get("blob_path"):
+        return await release_content(file_doc["sha256"])
+    await get_storage().delete(file_blob_path(file_doc))
+    from ingestion import remove_page_index, index_key
+    await remove_page_index(index_key(file_doc))
+    return True
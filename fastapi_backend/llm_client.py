@@ -0,0 +1,185 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+import httpx
+
+
+class LLMUnavailableError(Exception):
+    """Raised when a completion still fails after every retry (rate limit, upstream error or timeout)."""
+
+
+class LatencyMetrics:
+    """Rolling latency window plus call/error/retry counters."""
+    def __init__(self, window: int = 1000):
+        self._latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+
+    def observe(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+
+class LLMClient:
+    """
+    Shared AsyncOpenAI wrapper used by every endpoint that calls the model.
+
+    One pooled HTTP client is reused for all calls. Calls are capped by a
+    global semaphore and a per-user semaphore, bounded by a per-call timeout,
+    and retried with jittered exponential backoff on 429, 5xx, timeouts and
+    connection errors. Streams are only retried until the first chunk arrives.
+
+    Attributes:
+        max_concurrency: Calls in flight across the whole process.
+        per_user_concurrency: Calls in flight for one user key.
+        timeout: Per-call timeout in seconds.
+        max_retries: Retries after the first attempt.
+    """
+    def __init__(self, max_connections: int, max_concurrency: int, per_user_concurrency: int,
+                 connect_timeout: float, timeout: float, max_retries: int,
+                 backoff_base: float, backoff_max: float):
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client = None
+        self._global = asyncio.Semaphore(max_concurrency)
+        # user key -> [semaphore, number of callers holding or waiting on it]
+        self._per_user = {}
+        self.metrics = LatencyMetrics()
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        # Built on first use so importing the app does not need credentials
+        # (openai is also imported here: it is the slowest import of the app)
+        if self._client is None:
+            from openai import AsyncOpenAI
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            )
+            self._client = AsyncOpenAI(http_client=http_client, max_retries=0, timeout=self.timeout)
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self, user_key: str | None):
+        user_slot = None
+        if user_key is not None:
+            user_slot = self._per_user.setdefault(user_key, [asyncio.Semaphore(self.per_user_concurrency), 0])
+            user_slot[1] += 1
+        try:
+            if user_slot is not None:
+                await user_slot[0].acquire()
+            try:
+                async with self._global:
+                    self.metrics.in_flight += 1
+                    try:
+                        yield
+                    finally:
+                        self.metrics.in_flight -= 1
+            finally:
+                if user_slot is not None:
+                    user_slot[0].release()
+        finally:
+            if user_slot is not None:
+                user_slot[1] -= 1
+                if user_slot[1] == 0:
+                    self._per_user.pop(user_key, None)
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        from openai import APIStatusError, APIConnectionError, APITimeoutError
+        if isinstance(error, (APITimeoutError, APIConnectionError)):
+            return True
+        return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        from openai import APIStatusError
+        retry_after = None
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter: uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _with_retries(self, call):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            self.metrics.calls += 1
+            try:
+                result = await call()
+                self.metrics.observe(time.perf_counter() - start)
+                return result
+            except Exception as e:
+                self.metrics.errors += 1
+                if not self._retryable(e):
+                    raise
+                if attempt >= self.max_retries:
+                    raise LLMUnavailableError(f"Model call failed after {attempt + 1} attempts: {e}") from e
+                self.metrics.retries += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+                attempt += 1
+
+    async def chat(self, messages: list, model: str, user_key: str | None = None) -> str:
+        async with self._slot(user_key):
+            completion = await self._with_retries(
+                lambda: self.client.chat.completions.create(model=model, messages=messages, timeout=self.timeout)
+            )
+        return completion.choices[0].message.content
+
+    async def chat_stream(self, messages: list, model: str, user_key: str | None = None):
+        """Yields content tokens; holds the concurrency slots until the stream is closed."""
+        async with self._slot(user_key):
+            stream = await self._with_retries(
+                lambda: self.client.chat.completions.create(model=model, messages=messages,
+                                                            stream=True, timeout=self.timeout)
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+
+    async def embed(self, texts: list, model: str, user_key: str | None = None) -> list:
+        """Embedding vectors of `texts`, in order."""
+        async with self._slot(user_key):
+            result = await self._with_retries(
+                lambda: self.client.embeddings.create(model=model, input=texts, timeout=self.timeout)
+            )
+        return [item.embedding for item in sorted(result.data, key=lambda item: item.index)]
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {**self.metrics.stats(), "users_waiting_or_active": len(self._per_user)}
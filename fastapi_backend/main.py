@@ -2,17 +2,78 @@ from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query
 from pydantic import BaseModel
 from starlette import status
 from fastapi.middleware.cors import CORSMiddleware
-from utility_functions import *
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+import asyncio
 import datetime
+import httpx
+import json
+import time
 import uvicorn
-from google.cloud import storage
-from dotenv import load_dotenv
-from mongo_apis import *
-from openai import OpenAI
-
-load_dotenv()
-client = OpenAI()
-app = FastAPI()
+from contextlib import asynccontextmanager
+from mongo_apis_async import *
+from pymongo.errors import DuplicateKeyError
+from config import (HISTORY_WINDOW, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TITLE_JOB_WORKERS, CHAT_MODEL,
+                    COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL_S, COMPLETION_CACHE_DIR,
+                    COMPLETION_CACHE_DISK_ENTRIES, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_CONCURRENCY,
+                    OPENAI_PER_USER_CONCURRENCY, OPENAI_CONNECT_TIMEOUT_S, OPENAI_TIMEOUT_S,
+                    OPENAI_MAX_RETRIES, OPENAI_BACKOFF_BASE_S, OPENAI_BACKOFF_MAX_S, SESSION_OWNER_CACHE_SIZE,
+                    CLEANUP_JOB_WORKERS, ORPHAN_GC_INTERVAL_S, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES,
+                    SIGNED_URL_TTL_S, SIGNED_URL_REFRESH_MARGIN_S, SIGNED_URL_CACHE_SIZE,
+                    INGEST_JOB_WORKERS, EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIM,
+                    EMBEDDING_BATCH_SIZE, RETRIEVAL_INDEX_DIR, RETRIEVAL_CHUNK_CHARS,
+                    RETRIEVAL_CHUNK_OVERLAP, RETRIEVAL_TOP_K, RETRIEVAL_OPEN_INDEXES,
+                    BULK_UPLOAD_MAX_FILES, BULK_UPLOAD_CONCURRENCY, PDF_LINEARIZE,
+                    USER_QUOTA_BYTES, USER_QUOTA_FILES, LIBGEN_SEARCH_URL, LIBGEN_MAX_CONNECTIONS,
+                    LIBGEN_PER_HOST_CONCURRENCY, LIBGEN_CONNECT_TIMEOUT_S, LIBGEN_READ_TIMEOUT_S,
+                    LIBGEN_HTTP2, HTML_PARSER_BACKEND, LIBGEN_DOWNLOAD_RETRIES, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL_S, SEARCH_CACHE_STALE_S,
+                    LIBGEN_IMPORT_WORKERS, IMPORT_PROGRESS_INTERVAL_S, IMPORT_JOB_STALE_S, IMPORT_EVENTS_POLL_S)
+from completion_cache import CompletionCache
+from cache_utils import TTLCache
+from llm_client import LLMClient, LLMUnavailableError
+from storage import FileTooLargeError, LocalStorage, get_storage
+from library import (store_upload, reference_stored_content, release_content,
+                     release_file, file_blob_path, BlobBusyError)
+from jobs import JobRunner, find_job, close_all_runners
+from ingestion import ingest_book, index_key, index_status, get_page_range, shutdown_process_pool
+from retrieval import VectorIndexStore, make_embedder
+from pdf_optimize import optimize_pdf, preferred_blob_path
+from libgen_client import LibGenClient
+from search_cache import SearchCache
+from import_progress import ImportProgress, import_job_view
+
+background_tasks = []
+
+async def create_indexes_in_background():
+    # Off the startup path: the app serves requests while indexes are checked/built
+    try:
+        failures = await create_indexes()
+    except Exception as e:
+        print(f"[startup] index creation failed: {e}")
+        return
+    for collection_name, index_name, error in failures:
+        print(f"[startup] index {collection_name}.{index_name} not created: {error}")
+    if any(index_name == "user_file_name" for _, index_name, _ in failures):
+        print("[startup] run `python indexes.py` to list the duplicate file names blocking user_file_name")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # External clients are created here (Mongo) or on first use (GCS, OpenAI), never at import.
+    # Bucket CORS is configured once with admin_set_bucket_cors.py.
+    init_mongo()
+    background_tasks.append(asyncio.create_task(create_indexes_in_background()))
+    if ORPHAN_GC_INTERVAL_S > 0:
+        background_tasks.append(asyncio.create_task(run_orphan_gc(ORPHAN_GC_INTERVAL_S)))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await close_all_runners()
+    shutdown_process_pool()
+    await llm.close()
+    await search_cache.close()
+    await libgen.close()
+    await close_mongo()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,42 +83,173 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-## GCS Bucket Setup
-gcs_client = storage.Client.from_service_account_json("winter-agility-425909-q9-73e61deee040.json")
-bucket_name = "user-pdfs-for-digital-library"
-bucket = gcs_client.bucket(bucket_name)
-# Set and patch the CORS
-cors_configuration = [{
-    "origin": ["*"],  # or ["https://your-frontend.com"]
-    "responseHeader": ["Content-Type"],
-    "method": ["GET", "HEAD"],
-    "maxAgeSeconds": 3600
-}]
-bucket.cors = cors_configuration
-bucket.patch()
+# Shared pooled async OpenAI client used by every model call
+llm = LLMClient(
+    OPENAI_MAX_CONNECTIONS, OPENAI_MAX_CONCURRENCY, OPENAI_PER_USER_CONCURRENCY,
+    OPENAI_CONNECT_TIMEOUT_S, OPENAI_TIMEOUT_S, OPENAI_MAX_RETRIES,
+    OPENAI_BACKOFF_BASE_S, OPENAI_BACKOFF_MAX_S
+)
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(request, exc: LLMUnavailableError):
+    return JSONResponse(status_code=503, content={"detail": "The language model is busy, please retry shortly."},
+                        headers={"Retry-After": "5"})
+
+# Session titles are generated in the background, at most one job per session at a time
+title_jobs = JobRunner("session-titles", TITLE_JOB_WORKERS)
+# Messages of deleted sessions are purged in batches off the request path
+cleanup_jobs = JobRunner("session-cleanup", CLEANUP_JOB_WORKERS)
+
+
+# Per-book chunk embeddings for book-grounded chat, built after text extraction
+vector_store = VectorIndexStore(
+    RETRIEVAL_INDEX_DIR, make_embedder(EMBEDDING_BACKEND, llm, EMBEDDING_MODEL, EMBEDDING_DIM),
+    RETRIEVAL_CHUNK_CHARS, RETRIEVAL_CHUNK_OVERLAP, EMBEDDING_BATCH_SIZE, RETRIEVAL_OPEN_INDEXES
+)
+
+# Cached completions for repeated questions (same model and normalized history)
+completion_cache = CompletionCache(
+    COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL_S, COMPLETION_CACHE_DIR, COMPLETION_CACHE_DISK_ENTRIES
+)
 
 
 class Query(BaseModel):
     sessionId: str 
     question: str
+    bypassCache: bool = False
+    # Ground the answer in one of the user's books
+    fileId: str | None = None
+    userId: str | None = None
+
+async def book_context(query: Query):
+    """System message with the passages of the selected book most relevant to the question, or None."""
+    if not query.fileId:
+        return None
+    if not query.userId:
+        raise HTTPException(status_code=400, detail="userId is required with fileId.")
+    file_doc = await find_user_file(query.fileId, query.userId)
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found.")
+    passages = await vector_store.search(index_key(file_doc), query.question, RETRIEVAL_TOP_K)
+    if passages is None:
+        index = await index_status(file_doc)
+        if index["status"] == "failed":
+            # Requeued by /books/{file_id}/pages; retrying the chat would not help
+            raise HTTPException(status_code=422, detail=f"The book could not be indexed: {index['error']}")
+        ingest_jobs.submit(index_key(file_doc), index_book, file_doc)
+        raise HTTPException(status_code=409, detail="The book is still being indexed, retry shortly.")
+    excerpts = "\n\n".join(f"[page {p['page'] + 1}]\n{p['text']}" for p in passages)
+    return {"role": "system",
+            "content": f"Answer using these excerpts from the book \"{file_doc['file_name']}\" when relevant:\n\n{excerpts}"}
+
+async def build_chat_messages(sessionId: str, question: str, context: dict | None = None):
+    query_with_history = await retrieve_recent_history(sessionId, HISTORY_WINDOW)
+    query_with_history = [{"role": list(i.keys())[0], "content": list(i.values())[0]} for i in query_with_history]
+    if context is not None:
+        query_with_history.append(context)
+    query_with_history.append({"role": "user", "content": question})
+    return query_with_history
+
+def is_first_turn(messages: list) -> bool:
+    # Nothing but the question (and book context) means a new session
+    return all(m["role"] == "system" for m in messages[:-1])
+
+# Per-user model limits are keyed by the session's owner, so opening more sessions adds no capacity
+session_owners = TTLCache(SESSION_OWNER_CACHE_SIZE, float("inf"))
+
+async def llm_user_key(sessionId: str) -> str:
+    owner = session_owners.get(sessionId)
+    if owner is None:
+        owner = await get_session_user_id(sessionId) or f"session:{sessionId}"
+        session_owners.set(sessionId, owner)
+    return owner
+
+async def cached_completion(query: Query, messages: list):
+    """Returns (cache key, cached response or None), honouring the per-request bypass flag."""
+    cache_key = completion_cache.key(CHAT_MODEL, messages)
+    if query.bypassCache:
+        completion_cache.record_bypass()
+        return cache_key, None
+    return cache_key, await completion_cache.get(cache_key)
 
 @app.post("/get_bot_response", status_code = status.HTTP_200_OK)
 async def get_bot_response(query: Query):
     sessionId = query.sessionId
     question = query.question
-    query_with_history = retrieve_history(sessionId)[:7]
-    query_with_history = [{"role": list(i.keys())[0], "content": list(i.values())[0]} for i in query_with_history]
-    query_with_history.append({"role": "user", "content": question})
+    query_with_history = await build_chat_messages(sessionId, question, await book_context(query))
     print(query_with_history)
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=query_with_history
-    )
-    response = completion.choices[0].message.content
-    add_message(sessionId, "user", question)
-    add_message(sessionId, "assistant", response)
+    cache_key, response = await cached_completion(query, query_with_history)
+    if response is None:
+        response = await llm.chat(query_with_history, CHAT_MODEL, user_key=await llm_user_key(sessionId))
+        await completion_cache.set(cache_key, response)
+    await add_chat_turn(sessionId, question, response)
+    if is_first_turn(query_with_history):
+        title_jobs.submit(sessionId, generate_session_title, sessionId, question)
     return {"response": response}
 
+# Streaming variant: one NDJSON event per line
+#   {"type": "token", "content": "..."} as tokens arrive
+#   {"type": "done", "ttft_ms": ..., "total_ms": ..., "cached": ...} once the answer is stored
+# A cached answer is sent as a single token event.
+@app.post("/get_bot_response_stream", status_code = status.HTTP_200_OK)
+async def get_bot_response_stream(query: Query):
+    sessionId = query.sessionId
+    question = query.question
+    start = time.perf_counter()
+    query_with_history = await build_chat_messages(sessionId, question, await book_context(query))
+    cache_key, cached = await cached_completion(query, query_with_history)
+    from_cache = cached is not None
+    user_key = None if from_cache else await llm_user_key(sessionId)
+
+    async def upstream_tokens():
+        if from_cache:
+            yield cached
+            return
+        async for token in llm.chat_stream(query_with_history, CHAT_MODEL, user_key=user_key):
+            yield token
+
+    # Wait for the first token before answering, so an unavailable model is a 503
+    # and not a broken stream
+    tokens = upstream_tokens()
+    try:
+        first_token = await anext(tokens, None)
+    except BaseException:
+        await tokens.aclose()
+        raise
+
+    async def with_first_token():
+        if first_token is not None:
+            yield first_token
+        async for token in tokens:
+            yield token
+
+    async def token_stream():
+        ttft_ms = None
+        parts = []
+        try:
+            async for token in with_first_token():
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                    print(f"[stream] session={sessionId} ttft={ttft_ms}ms")
+                parts.append(token)
+                yield json.dumps({"type": "token", "content": token}) + "\n"
+        finally:
+            # Runs on completion and when the client disconnects (the generator is cancelled),
+            # so the upstream HTTP stream is never left open
+            await tokens.aclose()
+
+        # Only a fully received answer is persisted; a disconnect stops above
+        response = "".join(parts)
+        if not from_cache:
+            await completion_cache.set(cache_key, response)
+        await add_chat_turn(sessionId, question, response)
+        if is_first_turn(query_with_history):
+            title_jobs.submit(sessionId, generate_session_title, sessionId, question)
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        yield json.dumps({"type": "done", "ttft_ms": ttft_ms, "total_ms": total_ms, "cached": from_cache}) + "\n"
+
+    return StreamingResponse(token_stream(), media_type="application/x-ndjson")
+
 class message_update(BaseModel):
     sessionId: str 
     questionId: str
@@ -68,22 +260,35 @@ async def update_message(data: message_update):
     sessionId = data.sessionId
     questionId = data.questionId
     newQuestion = data.newQuestion
-    update_history(sessionId, questionId, newQuestion)
+    await update_history(sessionId, questionId, newQuestion)
     return {"response": "Succesful"}
 
+async def paginate(items, limit: int, sort_key: str, id_key: str):
+    try:
+        return await collect_page(items, limit, sort_key, id_key)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def page_size(limit: int) -> int:
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
 @app.get("/get_all_session/{userId}", status_code = status.HTTP_200_OK)
-async def get_all_session(userId: str):
-    all = retrieve_all_sessions(userId)
-    return {"response": all}
+async def get_all_session(userId: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+    limit = page_size(limit)
+    all, next_cursor = await paginate(retrieve_all_sessions(userId, limit + 1, cursor), limit, "last_active", "session_id")
+    return {"response": all, "next_cursor": next_cursor}
 
 @app.get("/session_history/{sessionId}", status_code = status.HTTP_200_OK)
-async def get_session_history(sessionId: str):
-    all = retrieve_history(sessionId)
-    return {"response": all}
+async def get_session_history(sessionId: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+    limit = page_size(limit)
+    all, next_cursor = await paginate(retrieve_history(sessionId, limit + 1, cursor), limit, "timestamp", "id")
+    return {"response": all, "next_cursor": next_cursor}
 
 @app.delete("/delete_session/{session_id}", status_code = status.HTTP_200_OK)
 async def delete_session(session_id: str):
-    delete_user_session(session_id)
+    await delete_user_session(session_id)
+    job = cleanup_jobs.submit(session_id, purge_session_messages, session_id)
+    return {"response": "Session deleted", "cleanup_job": job}
 
 class User(BaseModel):
     username: str
@@ -91,79 +296,287 @@ class User(BaseModel):
 
 @app.post("/create_user", status_code = status.HTTP_200_OK)
 async def create_user_db(data: User):
-    create_user({"name": data.username, "email": data.email})
+    await create_user({"name": data.username, "email": data.email})
 
 class SessionCreateRequest(BaseModel):
     userId: str
 
 @app.post("/create_session", status_code = status.HTTP_200_OK)
 async def create_session(data: SessionCreateRequest):
-    sess_id = create_user_session(data.userId)
+    sess_id = await create_user_session(data.userId)
     return {"response": str(sess_id)}
 
 @app.post("/get_user_id", status_code = status.HTTP_200_OK)
 async def get_user_id(data: User):
-    userid = retrieve_user_id({"name": data.username, "email": data.email})
+    userid = await retrieve_user_id({"name": data.username, "email": data.email})
     return {"userId": userid}
 
 class SessionTitleRequest(BaseModel):
     sessionId: str
 
-@app.post("/update_title", status_code = status.HTTP_200_OK)
-async def update_title(data: SessionTitleRequest):
-    sessionId = data.sessionId
-    messages = retrieve_history(sessionId)
-    message = list(messages[0].values())[0]
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
+async def generate_session_title(sessionId: str, message: str | None = None):
+    if message is None:
+        messages = [m async for m in retrieve_history(sessionId, limit=1)]
+        if not messages:
+            raise ValueError("Session has no messages to make a title from.")
+        message = list(messages[0].values())[0]
+    title = await llm.chat(
+        [
             {
                 "role": "user",
                 "content": f"Make a title for the following question of the user. Keep it of 2 words if possible otherwise not more than 5 words please. \n{message}"
             }
-        ]
+        ],
+        CHAT_MODEL,
+        user_key=await llm_user_key(sessionId)
     )
-    title = completion.choices[0].message.content
-    update_session_title(sessionId, title)
-    return {"response": "Title updated"}
+    await update_session_title(sessionId, title)
+
+@app.post("/update_title", status_code = status.HTTP_202_ACCEPTED)
+async def update_title(data: SessionTitleRequest):
+    job = title_jobs.submit(data.sessionId, generate_session_title, data.sessionId)
+    return {"response": "Title generation queued", "job": job}
+
+@app.get("/metrics", status_code = status.HTTP_200_OK)
+async def get_metrics():
+    return {
+        "completion_cache": completion_cache.stats(),
+        "history_cache": history_cache.stats(),
+        "title_jobs": title_jobs.stats(),
+        "openai": llm.stats(),
+        "cleanup_jobs": cleanup_jobs.stats(),
+        "message_cleanup": cleanup_stats(),
+        "chat_write_buffer": write_buffer_stats(),
+        "signed_url_cache": signed_url_cache.stats(),
+        "ingest_jobs": ingest_jobs.stats(),
+        "retrieval": vector_store.stats(),
+        "libgen": libgen.stats(),
+        "search_cache": search_cache.stats(),
+        "libgen_import_jobs": libgen_import_jobs.stats(),
+    }
+
+@app.get("/jobs/{job_id}", status_code = status.HTTP_200_OK)
+async def get_job_status(job_id: str):
+    job = find_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {"job": job}
 
 
 #### ENDPOINTS FOR BOOKS HANDLING  ######
+signed_url_cache = TTLCache(SIGNED_URL_CACHE_SIZE, SIGNED_URL_TTL_S - SIGNED_URL_REFRESH_MARGIN_S)
+# Text of uploaded books is extracted in the background, once per distinct content
+ingest_jobs = JobRunner("book-ingestion", INGEST_JOB_WORKERS)
+
+async def index_book(file_doc: dict):
+    # Linearized copy first (it speeds up the viewer), then the page index and the
+    # retrieval index built from it
+    if PDF_LINEARIZE and file_doc["format"] == "pdf" and file_doc.get("sha256") and file_doc.get("blob_path"):
+        try:
+            await optimize_pdf(file_doc["sha256"])
+        except Exception as e:
+            print(f"[ingestion] PDF linearization failed for {file_doc['sha256']}: {e}")
+    await ingest_book(file_doc)
+    await vector_store.build(index_key(file_doc))
+
+def quota_error(usage: dict, new_files: int, new_bytes: int):
+    """Why adding these files would exceed the user's quota, or None."""
+    if USER_QUOTA_FILES and usage["file_count"] + new_files > USER_QUOTA_FILES:
+        return f"Storage quota exceeded: at most {USER_QUOTA_FILES} files."
+    if USER_QUOTA_BYTES and usage["total_bytes"] + new_bytes > USER_QUOTA_BYTES:
+        return f"Storage quota exceeded: at most {USER_QUOTA_BYTES} bytes."
+    return None
+
+async def check_quota(user_id: str, new_files: int, new_bytes: int):
+    # Early refusal before transferring anything: one point read of the user's counters.
+    # Enforced atomically when the file is added (reserve_usage).
+    if not USER_QUOTA_FILES and not USER_QUOTA_BYTES:
+        return
+    error = quota_error(await get_user_usage(user_id), new_files, new_bytes)
+    if error:
+        raise HTTPException(status_code=403, detail=error)
+
+async def register_user_file(filename, user_id, filesize, sha256, blob_path):
+    """Saves the user's file metadata, releasing the blob reference if the name is taken or the quota is full."""
+    upload_date = datetime.datetime.now(datetime.UTC)
+    file_format = filename.split('.')[-1]
+    # The unique index settles concurrent uploads of the same name, the usage reservation
+    # in add_file concurrent uploads against the quota
+    try:
+        file_id = await add_file(filename, user_id, filesize, file_format, upload_date, sha256, blob_path,
+                                 USER_QUOTA_FILES, USER_QUOTA_BYTES)
+    except DuplicateKeyError:
+        await release_content(sha256)
+        raise HTTPException(status_code=409, detail="A file with the same name already exists.")
+    except QuotaExceededError as e:
+        await release_content(sha256)
+        raise HTTPException(status_code=403, detail=str(e))
+    queue_book_indexing(file_id, user_id, filename, file_format, sha256, blob_path)
+    return file_id
+
+def queue_book_indexing(file_id, user_id, filename, file_format, sha256, blob_path):
+    file_doc = {"_id": file_id, "user_id": user_id, "file_name": filename, "format": file_format,
+                "sha256": sha256, "blob_path": blob_path}
+    ingest_jobs.submit(index_key(file_doc), index_book, file_doc)
+
 # Upload Endpoint
+# Books are stored once per distinct content. To add a copy of a book the user already
+# has under another name, the client may send `sha256` and `file_name` without the file.
+# With a file, `sha256` is ignored: the content is identified by hashing the bytes.
 @app.post("/upload/")
 async def upload_file(
-    file: UploadFile = File(...),
-    user_id: str = Form(...)
+    file: UploadFile | None = File(None),
+    user_id: str = Form(...),
+    file_name: str | None = Form(None),
+    sha256: str | None = Form(None)
 ):
+    filename = file.filename if file is not None else file_name
+    if not filename:
+        raise HTTPException(status_code=400, detail="A file or a file_name is required.")
+
     # Check file type
-    if not file.filename.endswith(('.pdf', '.epub')):
+    if not filename.endswith(('.pdf', '.epub')):
         raise HTTPException(status_code=400, detail="Only PDF or EPUB files are allowed.")
 
+    # Reject oversized files before transferring anything when the size is already known
+    if file is not None and file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes.")
+
     # Check if the file with the same filename already exists for this user
-    existing_file = books_collection.find_one({
-        "user_id": ObjectId(user_id),
-        "file_name": file.filename
-    })
+    existing_file = await find_user_file_by_name(filename, user_id)
     if existing_file:
         raise HTTPException(status_code=409, detail="A file with the same name already exists.")
 
-    # Define the blob path
-    blob_path = f"{user_id}/{file.filename}"
-    blob = bucket.blob(blob_path)
-
-    # Upload file to GCS
-    contents = await file.read()
-    blob.upload_from_string(contents, content_type=file.content_type)
-
-    # File metadata
-    filesize = len(contents)  # size in bytes
-    upload_date = datetime.datetime.now(datetime.UTC)
-    file_format = file.filename.split('.')[-1]
+    # Refuse before transferring anything when the quota is already full
+    await check_quota(user_id, 1, (file.size or 0) if file is not None else 0)
+
+    if file is None:
+        # Only content the user already references: a hash alone must not grant access to other users' books
+        blob_doc = None
+        if sha256 and await find_user_file_by_sha256(sha256.lower(), user_id):
+            blob_doc = await reference_stored_content(sha256=sha256.lower())
+        if blob_doc is None:
+            raise HTTPException(status_code=404, detail="Unknown content hash, upload the file itself.")
+        blob_path, filesize, sha256, deduplicated = blob_doc["path"], blob_doc["size"], blob_doc["_id"], True
+    else:
+        # Stream the file to storage in fixed-size chunks, measuring and hashing it on the way
+        try:
+            blob_path, filesize, sha256, deduplicated = await store_upload(
+                file.read, file.content_type, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES
+            )
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except BlobBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
 
     # Save file metadata in MongoDB
-    file_id = add_file(file.filename, user_id, filesize, file_format, upload_date)
-
-    return {"message": "File uploaded successfully", "file_id": file_id, "gcs_path": blob_path}
+    file_id = await register_user_file(filename, user_id, filesize, sha256, blob_path)
+
+    return {"message": "File uploaded successfully", "file_id": file_id, "gcs_path": blob_path,
+            "deduplicated": deduplicated}
+
+# Bulk upload Endpoint
+# Many files in one request: one duplicate-name query for the whole batch, files streamed
+# to storage BULK_UPLOAD_CONCURRENCY at a time, one insert for all the metadata.
+# Every file gets its own result; the response is 207 when some of them failed.
+@app.post("/upload-batch/")
+async def upload_files(
+    files: list[UploadFile] = File(...),
+    user_id: str = Form(...)
+):
+    if len(files) > BULK_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_UPLOAD_MAX_FILES} files per batch.")
+
+    results = [{"file_name": file.filename} for file in files]
+
+    def fail(i, status_code, detail):
+        results[i].update({"status": status_code, "detail": detail})
+
+    seen = set()
+    for i, file in enumerate(files):
+        if not file.filename or not file.filename.endswith(('.pdf', '.epub')):
+            fail(i, 400, "Only PDF or EPUB files are allowed.")
+        elif file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            fail(i, 413, f"File exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes.")
+        elif file.filename in seen:
+            fail(i, 409, "The same file name appears twice in the batch.")
+        seen.add(file.filename)
+
+    pending = [i for i, result in enumerate(results) if "status" not in result]
+    existing = await find_user_file_names([files[i].filename for i in pending], user_id) if pending else set()
+    for i in pending:
+        if files[i].filename in existing:
+            fail(i, 409, "A file with the same name already exists.")
+
+    slots = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+
+    async def store(i):
+        async with slots:
+            try:
+                results[i]["stored"] = await store_upload(
+                    files[i].read, files[i].content_type, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES
+                )
+            except FileTooLargeError as e:
+                fail(i, 413, str(e))
+            except BlobBusyError as e:
+                fail(i, 503, str(e))
+            except Exception as e:
+                fail(i, 500, f"Upload failed: {str(e)}")
+
+    await asyncio.gather(*(store(i) for i, result in enumerate(results) if "status" not in result))
+
+    # Files past the user's quota (in batch order) are released before anything is inserted;
+    # add_files then reserves the rest atomically
+    usage = await get_user_usage(user_id) if USER_QUOTA_FILES or USER_QUOTA_BYTES else None
+    for i, result in enumerate(results):
+        if "stored" not in result or usage is None:
+            continue
+        _, filesize, sha256, _ = result["stored"]
+        error = quota_error(usage, 1, filesize)
+        if error:
+            del result["stored"]
+            await release_content(sha256)
+            fail(i, 403, error)
+        else:
+            usage["file_count"] += 1
+            usage["total_bytes"] += filesize
+
+    stored = [i for i, result in enumerate(results) if "stored" in result]
+    entries = []
+    for i in stored:
+        blob_path, filesize, sha256, _ = results[i]["stored"]
+        entries.append({"file_name": files[i].filename, "size": filesize, "format": files[i].filename.split('.')[-1],
+                        "sha256": sha256, "blob_path": blob_path})
+    try:
+        file_ids = await add_files(entries, user_id, datetime.datetime.now(datetime.UTC),
+                                   USER_QUOTA_FILES, USER_QUOTA_BYTES) if entries else []
+    except QuotaExceededError as e:
+        # Concurrent uploads filled the quota since the check above
+        for i, entry in zip(stored, entries):
+            del results[i]["stored"]
+            await release_content(entry["sha256"])
+            fail(i, 403, str(e))
+        stored, entries, file_ids = [], [], []
+    except Exception:
+        for entry in entries:
+            await release_content(entry["sha256"])
+        raise
+
+    for i, entry, file_id in zip(stored, entries, file_ids):
+        blob_path, _, sha256, deduplicated = results[i].pop("stored")
+        if file_id is None:
+            # Lost a race with a concurrent upload of the same name
+            await release_content(sha256)
+            fail(i, 409, "A file with the same name already exists.")
+            continue
+        queue_book_indexing(file_id, user_id, entry["file_name"], entry["format"], sha256, blob_path)
+        results[i].update({"status": 200, "file_id": file_id, "gcs_path": blob_path, "deduplicated": deduplicated})
+
+    uploaded = sum(result["status"] == 200 for result in results)
+    return JSONResponse(
+        status_code=200 if uploaded == len(results) else 207,
+        content={"uploaded": uploaded, "failed": len(results) - uploaded, "results": results}
+    )
 
 # Delete Endpoint
 @app.delete("/delete/")
@@ -172,126 +585,266 @@ async def delete_file(
     file_id: str = Form(...)
 ):
     # Find file info
-    file_doc = books_collection.find_one({
-        "_id": ObjectId(file_id),
-        "user_id": ObjectId(user_id)
-    })
+    file_doc = await find_user_file(file_id, user_id)
     if not file_doc:
         raise HTTPException(status_code=404, detail="File not found.")
 
-    # GCS path
-    blob_path = f"{user_id}/{file_doc['file_name']}"
-    blob = bucket.blob(blob_path)
-
-    # Delete from GCS
-    if blob.exists():
-        blob.delete()
-    else:
-        raise HTTPException(status_code=404, detail="File not found in storage.")
-
-    # Delete metadata from MongoDB
-    status = delete_mongodb_file(file_id, user_id)
+    # Delete metadata from MongoDB, then drop this file's reference on the stored blob
+    # (the blob itself goes away with its last reference)
+    if not await delete_mongodb_file(file_id, user_id):
+        raise HTTPException(status_code=404, detail="File not found.")
+    signed_url_cache.invalidate((user_id, file_id))
+    if await release_file(file_doc):
+        # Last reference to the content: its retrieval index goes too
+        await vector_store.remove(index_key(file_doc))
     return {"message": "File deleted successfully."}
 
 
+BOOK_MEDIA_TYPES = {"pdf": "application/pdf", "epub": "application/epub+zip"}
+
 # Generate Temporary Link Endpoint
+# Signed URLs are cached per (user_id, file_id) and reused until SIGNED_URL_REFRESH_MARGIN_S
+# before they expire. The metadata document is the source of truth for existence.
 @app.get("/generate-link/")
 async def generate_temporary_link(
     user_id: str,
     file_id: str
 ):
-    file_doc = books_collection.find_one({
-        "_id": ObjectId(file_id),
-        "user_id": ObjectId(user_id)
-    })
+    url = signed_url_cache.get((user_id, file_id))
+    if url is not None:
+        return {"temporary_url": url}
+
+    file_doc = await find_user_file(file_id, user_id)
     if not file_doc:
         raise HTTPException(status_code=404, detail="File not found.")
 
-    blob_path = f"{user_id}/{file_doc['file_name']}"
-    blob = bucket.blob(blob_path)
+    # Generate signed URL, to the linearized copy of the PDF when there is one
+    default_path = file_blob_path(file_doc)
+    path = await preferred_blob_path(file_doc, default_path)
+    url = await get_storage().generate_url(path, SIGNED_URL_TTL_S, BOOK_MEDIA_TYPES.get(file_doc["format"]))
+    # Not cached while the linearized copy is still being made, so the next open gets it
+    optimizing = (PDF_LINEARIZE and file_doc["format"] == "pdf" and file_doc.get("sha256")
+                  and path == default_path)
+    if not optimizing:
+        signed_url_cache.set((user_id, file_id), url)
+
+    return {"temporary_url": url}
 
-    if not blob.exists():
+
+# Local storage backend only: serves signed links with HTTP Range support.
+# Blobs are stored under their content hash, so the media type travels in the signed link.
+@app.api_route("/files/{path:path}", methods=["GET", "HEAD"])
+async def serve_local_file(path: str, expires: int, sig: str, type: str | None = None):
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not found.")
+    if not storage.verify(path, expires, sig, type):
+        raise HTTPException(status_code=403, detail="Invalid or expired link.")
+    try:
+        full_path = storage.full_path(path)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found.")
+    if not await storage.exists(path):
         raise HTTPException(status_code=404, detail="File not found in storage.")
+    return FileResponse(full_path, media_type=type or "application/octet-stream")
 
-    # Generate signed URL (valid for 1 hour)
-    url = blob.generate_signed_url(
-        version="v4",
-        expiration=datetime.timedelta(hours=1),
-        method="GET"
-    )
 
-    return {"temporary_url": url}
+# Progress of the background text extraction of a book
+@app.get("/books/{file_id}/index")
+async def get_book_index(file_id: str, user_id: str):
+    file_doc = await find_user_file(file_id, user_id)
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return await index_status(file_doc)
+
+# Extracted text of pages start..end (0-based, inclusive; EPUB chapters count as pages)
+@app.get("/books/{file_id}/pages")
+async def get_book_pages(file_id: str, user_id: str, start: int = 0, end: int | None = None):
+    file_doc = await find_user_file(file_id, user_id)
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found.")
+    pages = await get_page_range(file_doc, start, start if end is None else end)
+    if pages is None:
+        # Not indexed yet (or indexing failed): (re)queue it and let the client poll
+        job = ingest_jobs.submit(index_key(file_doc), index_book, file_doc)
+        return JSONResponse(status_code=202, content={"status": (await index_status(file_doc))["status"],
+                                                      "job_id": job["job_id"]})
+    return {"pages": pages}
+
+
+# Storage used by a user (maintained incrementally) and their quota
+@app.get("/usage/{user_id}")
+async def get_usage(user_id: str):
+    usage = await get_user_usage(user_id)
+    return {"usage": usage, "quota": {"files": USER_QUOTA_FILES or None, "bytes": USER_QUOTA_BYTES or None}}
 
 
 @app.get("/api/books/{user_id}")
-async def get_all_books(user_id: str):
-    file_doc = list_file_ids_by_user(user_id)
-    return {"books": file_doc}
+async def get_all_books(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+    limit = page_size(limit)
+    file_doc, next_cursor = await paginate(list_file_ids_by_user(user_id, limit + 1, cursor), limit, "upload_datefile", "_id")
+    return {"books": file_doc, "next_cursor": next_cursor}
 
 
 ##### LIBGEN BOOK SEARCH AND DOWNLOAD ######
+# Shared pooled client: a slow mirror only holds its own connections, never the event loop
+libgen = LibGenClient(
+    LIBGEN_SEARCH_URL, LIBGEN_MAX_CONNECTIONS, LIBGEN_PER_HOST_CONCURRENCY,
+    LIBGEN_CONNECT_TIMEOUT_S, LIBGEN_READ_TIMEOUT_S, LIBGEN_HTTP2, HTML_PARSER_BACKEND,
+    LIBGEN_DOWNLOAD_RETRIES
+)
+# Repeated searches are answered from memory; identical concurrent ones share one fetch
+search_cache = SearchCache(libgen.search, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL_S, SEARCH_CACHE_STALE_S)
 
 # Search book
 @app.get("/search-libgen/")
 async def search_libgen(book_name: str, number: int):
     try:
-        books = fetch_libgen_books(book_name, number)
+        books = await search_cache.get(book_name, number)
         if not books:
             raise HTTPException(status_code=404, detail="No books found.")
         return {"count": len(books), "books": books}
-    except requests.HTTPError as e:
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail=f"Failed to fetch from LibGen: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     
 # Download a book
-@app.post("/libgen-upload/")
-async def libgen_upload(
-    book_detail_url: str = Form(...),
-    user_id: str = Form(...)
-):
+#
+# An import (two page fetches, the download and the storage upload) runs as a
+# background job. Its progress lives in an import_jobs document, which the client
+# polls (/libgen-imports/{job_id}) or follows as server-sent events (.../events).
+libgen_import_jobs = JobRunner("libgen-imports", LIBGEN_IMPORT_WORKERS)
+
+async def import_libgen_book(book_detail_url: str, user_id: str, progress: ImportProgress):
     """
     Downloads a book from LibGen and uploads it to GCS and MongoDB under the given user ID.
+    Raises HTTPException with the status the import failed with.
     """
     try:
-        file_object, filename = download_libgen_file(book_detail_url)
-        file_object.seek(0)
-
-        # Validate file type
-        if not filename.endswith(('.pdf', '.epub')):
-            raise HTTPException(status_code=400, detail="Only PDF or EPUB files are allowed.")
-
-        # Check if file already exists
-        existing_file = books_collection.find_one({
-            "user_id": ObjectId(user_id),
-            "file_name": filename
-        })
-        if existing_file:
-            raise HTTPException(status_code=409, detail="A file with the same name already exists.")
-
-        # Upload to GCS
-        blob_path = f"{user_id}/{filename}"
-        blob = bucket.blob(blob_path)
-        blob.upload_from_file(file_object, content_type="application/octet-stream")
-
-        # File metadata
-        file_object.seek(0, 2)  # move to end of file to get size
-        filesize = file_object.tell()  # size in bytes
-        upload_date = datetime.datetime.now(datetime.UTC)
-        file_format = filename.split('.')[-1]
+        # Book already imported from this URL by someone: reference it without downloading
+        blob_doc = await reference_stored_content(source_url=book_detail_url)
+        if blob_doc is not None:
+            filename = next(src["file_name"] for src in blob_doc["sources"] if src["url"] == book_detail_url)
+            if await find_user_file_by_name(filename, user_id):
+                await release_content(blob_doc["_id"])
+                raise HTTPException(status_code=409, detail="A file with the same name already exists.")
+            file_id = await register_user_file(filename, user_id, blob_doc["size"], blob_doc["_id"], blob_doc["path"])
+            await progress.done(blob_doc["size"], {"file_id": file_id, "gcs_path": blob_doc["path"], "deduplicated": True})
+            return
+
+        # The book is streamed from the mirror into storage chunk by chunk, sized and hashed on the way
+        await progress.state("resolving")
+        direct_download_url = await libgen.resolve_download_url(book_detail_url)
+        try:
+            async with libgen.open_download(direct_download_url, MAX_UPLOAD_BYTES) as download:
+                filename = download.filename
+
+                # Validate file type
+                if not filename.endswith(('.pdf', '.epub')):
+                    raise HTTPException(status_code=400, detail="Only PDF or EPUB files are allowed.")
+
+                # Check if file already exists
+                existing_file = await find_user_file_by_name(filename, user_id)
+                if existing_file:
+                    raise HTTPException(status_code=409, detail="A file with the same name already exists.")
+                await check_quota(user_id, 1, download.size or 0)
+
+                async def read(n: int) -> bytes:
+                    chunk = await download.read(n)
+                    await progress.downloaded(download.received, download.size)
+                    return chunk
+
+                # Upload to storage unless the same content is already stored
+                await progress.state("downloading", bytes_total=download.size)
+                blob_path, filesize, sha256, deduplicated = await store_upload(
+                    read, "application/octet-stream", MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES,
+                    source={"url": book_detail_url, "file_name": filename}
+                )
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except BlobBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
 
         # Save metadata in MongoDB
-        file_id = add_file(filename, user_id, filesize, file_format, upload_date)
+        await progress.state("storing", bytes_downloaded=filesize)
+        file_id = await register_user_file(filename, user_id, filesize, sha256, blob_path)
+        await progress.done(filesize, {"file_id": file_id, "gcs_path": blob_path, "deduplicated": deduplicated})
 
-        return {"message": "File uploaded successfully", "file_id": file_id, "gcs_path": blob_path}
-
-    except requests.HTTPError as e:
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail=f"Failed to fetch pages: {str(e)}")
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    
+
+async def run_libgen_import(job_id, book_detail_url: str, user_id: str):
+    # A job left queued past IMPORT_JOB_STALE_S may have been replaced by a new one: do not import twice
+    if not await start_import_job(job_id):
+        return
+    progress = ImportProgress(job_id, IMPORT_PROGRESS_INTERVAL_S)
+    try:
+        await import_libgen_book(book_detail_url, user_id, progress)
+    except HTTPException as e:
+        await progress.failed(e.detail, e.status_code)
+        # Also counted as failed by the runner
+        raise
+    except asyncio.CancelledError:
+        # Shutting down: do not leave the job active until it goes stale
+        await progress.failed("Import interrupted.", 503)
+        raise
+
+@app.post("/libgen-upload/", status_code = status.HTTP_202_ACCEPTED)
+async def libgen_upload(
+    book_detail_url: str = Form(...),
+    user_id: str = Form(...)
+):
+    """
+    Queues the import of a book from LibGen under the given user ID. A second
+    request for a URL the user is already importing returns the running job.
+    """
+    job, created = await create_import_job(user_id, book_detail_url, IMPORT_JOB_STALE_S)
+    if created:
+        libgen_import_jobs.submit(str(job["_id"]), run_libgen_import, job["_id"], book_detail_url, user_id)
+    return {"job": import_job_view(job), "created": created}
+
+async def find_import_job(job_id: str, user_id: str) -> dict:
+    job = await get_import_job(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found.")
+    return job
+
+@app.get("/libgen-imports/{job_id}")
+async def get_libgen_import(job_id: str, user_id: str):
+    return {"job": import_job_view(await find_import_job(job_id, user_id))}
+
+@app.get("/libgen-imports/{job_id}/events")
+async def stream_libgen_import(job_id: str, user_id: str):
+    """Server-sent events: a `progress` event per change of the job, then `done` or `failed`."""
+    job = await find_import_job(job_id, user_id)
+
+    async def events(job):
+        last = None
+        while True:
+            view = import_job_view(job)
+            current = (view["state"], view["bytes_downloaded"], view["bytes_total"])
+            if not job["active"]:
+                yield f"event: {view['state']}\ndata: {json.dumps(view)}\n\n"
+                return
+            if current != last:
+                last = current
+                yield f"event: progress\ndata: {json.dumps(view)}\n\n"
+            await asyncio.sleep(IMPORT_EVENTS_POLL_S)
+            job = await get_import_job(job_id, user_id)
+            if job is None:  # Expired
+                return
+
+    return StreamingResponse(events(job), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 
@@ -0,0 +1,715 @@
+"""
+Async (Motor) variant of mongo_apis.py with the same function surface.
+Every function is a coroutine so the FastAPI handlers can await them
+without blocking the event loop.
+"""
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING, ASCENDING, ReturnDocument, ReplaceOne
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+import asyncio
+import base64
+import datetime
+import json
+from config import (MONGO_URI, MONGO_DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE,
+                    MONGO_MAX_IDLE_TIME_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    HISTORY_CACHE_SESSIONS, HISTORY_CACHE_MESSAGES,
+                    CHAT_WRITE_BEHIND, CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_FLUSH_INTERVAL_S,
+                    CLEANUP_BATCH_SIZE)
+from cleanup import MessageCleanup
+from history_cache import SessionHistoryCache
+from indexes import ensure_indexes
+from write_behind import ChatWriteBuffer
+
+# Clients and collections are created by init_mongo() from the app lifespan,
+# so importing this module does no I/O. Functions look them up at call time.
+client = None
+db = None
+user_collection = None
+session_collection = None
+message_collection = None
+books_collection = None
+blobs_collection = None
+page_index_collection = None
+usage_collection = None
+import_jobs_collection = None
+message_cleanup = None
+chat_write_buffer = None
+
+# Recent turns per session, so the common chat turn does not touch the database
+history_cache = SessionHistoryCache(HISTORY_CACHE_SESSIONS, HISTORY_CACHE_MESSAGES)
+
+def init_mongo():
+    global client, db, user_collection, session_collection, message_collection, books_collection
+    global blobs_collection, page_index_collection, usage_collection, import_jobs_collection, message_cleanup, chat_write_buffer
+    if client is not None:
+        return
+    # Establish a pooled connection to MongoDB (pool sizing lives in config.py)
+    client = AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    )
+    db = client[MONGO_DB_NAME]
+
+    user_collection = db['users']
+    session_collection = db['sessions']
+    message_collection = db['messages']
+    books_collection = db['uploaded_files']
+    blobs_collection = db['blobs']
+    page_index_collection = db['page_index']
+    usage_collection = db['user_usage']
+    import_jobs_collection = db['import_jobs']
+
+    # Batched removal of messages left behind by deleted sessions
+    message_cleanup = MessageCleanup(message_collection, session_collection, CLEANUP_BATCH_SIZE)
+
+    # Optional write-behind buffer for chat turns (see add_chat_turn)
+    chat_write_buffer = ChatWriteBuffer(
+        message_collection, session_collection, CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_FLUSH_INTERVAL_S
+    ) if CHAT_WRITE_BEHIND else None
+
+async def close_mongo():
+    global client
+    if client is None:
+        return
+    # Drain buffered chat writes before the connection goes away
+    if chat_write_buffer is not None:
+        await chat_write_buffer.close()
+    client.close()
+    client = None
+
+async def create_user(userDetails: dict):
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    created_at = timestamp
+    name = userDetails['name']
+    mailid = userDetails['email']
+    await user_collection.insert_one({"name": name, "email": mailid, "created_at": created_at})
+
+async def retrieve_user_id(userDetails: dict):
+    user_info = await user_collection.find_one(userDetails)
+    return str(user_info["_id"])
+
+async def create_user_session(userid: str):
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    result = await session_collection.insert_one({
+        "user_id": ObjectId(userid),
+        "title": None,
+        "created_at": timestamp,
+        "last_active": timestamp
+    })
+    return result.inserted_id
+
+async def get_session_user_id(sessionId: str):
+    """Owner of a session as a string, or None for an unknown session."""
+    session = await session_collection.find_one({"_id": ObjectId(sessionId)}, {"user_id": 1})
+    return str(session["user_id"]) if session else None
+
+async def update_session_title(sessionId: str, title: str):
+    await session_collection.update_one({
+        "_id": ObjectId(sessionId)},
+        {"$set": {"title": title}
+    })
+
+async def update_session_last_active(sessionId: str):
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    await session_collection.update_one({
+        "_id": ObjectId(sessionId)},
+        {"$set": {"last_active": timestamp}
+    })
+
+##### KEYSET PAGINATION ######
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(sort_value: datetime.datetime, item_id: str) -> str:
+    payload = json.dumps({"v": sort_value.isoformat(), "id": str(item_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(payload["v"]), ObjectId(payload["id"])
+    except Exception:
+        raise InvalidCursor("Invalid cursor.")
+
+def keyset_filter(field: str, direction: int, cursor: str | None) -> dict:
+    """Filter selecting the documents strictly after `cursor` in (field, _id) order."""
+    if not cursor:
+        return {}
+    value, last_id = decode_cursor(cursor)
+    op = "$gt" if direction == ASCENDING else "$lt"
+    return {"$or": [{field: {op: value}}, {field: value, "_id": {op: last_id}}]}
+
+async def collect_page(items, limit: int, sort_key: str, id_key: str):
+    """
+    Drains a generator opened with `limit + 1` into one page.
+    Returns the page and the cursor of the next one (None on the last page).
+    """
+    page = [item async for item in items]
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(page[-1][sort_key], page[-1][id_key])
+
+async def retrieve_all_sessions(userId, limit: int | None = None, cursor: str | None = None):
+    query = {"user_id": ObjectId(userId), **keyset_filter("last_active", DESCENDING, cursor)}
+    all_sessions = session_collection.find(query).sort([("last_active", DESCENDING), ("_id", DESCENDING)])
+    if limit:
+        all_sessions = all_sessions.limit(limit)
+    async for session in all_sessions:
+        yield {"session_id": str(session["_id"]) , "title": session["title"], "last_active": session["last_active"]}
+
+async def add_message(sessionId: str, sender: str, message: str):
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    result = await message_collection.insert_one({
+        "session_id": ObjectId(sessionId),
+        "sender": sender,   #user/assistant
+        "message": message,
+        "timestamp": timestamp
+    })
+    message_id = str(result.inserted_id)
+    history_cache.append(sessionId, {sender: message, "id": message_id})
+    return message_id
+
+async def add_chat_turn(sessionId: str, question: str, response: str):
+    """
+    Persists one question/answer pair and bumps the session's last_active.
+    Both messages go out in a single insert_many, run concurrently with the
+    session update (or are handed to the write-behind buffer when enabled).
+    """
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    session_id = ObjectId(sessionId)
+    # BSON dates have millisecond precision, keep the answer strictly after the question
+    docs = [
+        {"_id": ObjectId(), "session_id": session_id, "sender": "user",
+         "message": question, "timestamp": timestamp},
+        {"_id": ObjectId(), "session_id": session_id, "sender": "assistant",
+         "message": response, "timestamp": timestamp + datetime.timedelta(milliseconds=1)},
+    ]
+    if chat_write_buffer is not None:
+        # Accepted by the buffer, which retries failed batches
+        chat_write_buffer.add(docs, session_id, timestamp)
+    else:
+        try:
+            await asyncio.gather(
+                message_collection.insert_many(docs),
+                session_collection.update_one({"_id": session_id}, {"$max": {"last_active": timestamp}})
+            )
+        except Exception:
+            # Part of the turn may be stored: let the next read rebuild the window
+            history_cache.invalidate(sessionId)
+            raise
+    # Cached only once written, so a failed turn never reaches later prompts
+    for doc in docs:
+        history_cache.append(sessionId, {doc["sender"]: doc["message"], "id": str(doc["_id"])})
+
+async def create_indexes():
+    return await ensure_indexes(db)
+
+async def run_orphan_gc(interval: float):
+    await message_cleanup.run_periodic(interval)
+
+def cleanup_stats():
+    return message_cleanup.stats() if message_cleanup is not None else None
+
+def write_buffer_stats():
+    return chat_write_buffer.stats() if chat_write_buffer is not None else None
+
+async def retrieve_history(sessionId: str, limit: int | None = None, cursor: str | None = None):
+    query = {"session_id": ObjectId(sessionId), **keyset_filter("timestamp", ASCENDING, cursor)}
+    sorted_messages = message_collection.find(query).sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+    if limit:
+        sorted_messages = sorted_messages.limit(limit)
+    async for i in sorted_messages:
+        yield {i["sender"]: i["message"], "id": str(i["_id"]), "timestamp": i["timestamp"]}
+
+async def retrieve_recent_history(sessionId: str, limit: int):
+    """
+    Returns the last `limit` messages of a session, oldest first.
+    Served from the per-session cache when possible, otherwise the window is
+    read newest-first with limit and projection pushed into the query.
+    """
+    cached = history_cache.get(sessionId, limit)
+    if cached is not None:
+        return cached
+    generation = history_cache.begin_fill(sessionId)
+    fetch = max(limit, history_cache.max_messages)
+    latest_messages = message_collection.find(
+        {"session_id": ObjectId(sessionId)},
+        {"sender": 1, "message": 1}
+    ).sort("timestamp", DESCENDING).limit(fetch)
+    messages = [{i["sender"]: i["message"], "id": str(i["_id"])} async for i in latest_messages]
+    messages.reverse()
+    history_cache.fill(sessionId, messages, generation)
+    return messages[-limit:] if limit else []
+
+async def delete_user_session(sessionId: str):
+    """Deletes the session document; its messages are removed by purge_session_messages."""
+    if chat_write_buffer is not None:
+        # Not written yet: they would land after the purge as orphans
+        chat_write_buffer.discard_session(ObjectId(sessionId))
+    await session_collection.delete_one({
+        "_id": ObjectId(sessionId)
+    })
+    history_cache.invalidate(sessionId)
+
+async def purge_session_messages(sessionId: str):
+    return await message_cleanup.purge_session(ObjectId(sessionId))
+
+async def update_history(sessionId: str, questionId: str, new_message: str):
+    # 0. Write buffered turns first, or they would be inserted after the truncation below
+    if chat_write_buffer is not None:
+        await chat_write_buffer.flush()
+
+    # 1. Retrieve the current question using questionId
+    question = await message_collection.find_one({
+        "_id": ObjectId(questionId),
+        "session_id": ObjectId(sessionId)
+    })
+    timestamp = question["timestamp"]
+
+    # 2. Delete all messages in the same session with a timestamp greater than the current question
+    await message_collection.delete_many({
+        "session_id": ObjectId(sessionId),
+        "timestamp": { "$gte": timestamp }
+    })
+
+    # 3. Update the message content of the original question
+    await message_collection.update_one(
+        { "_id": ObjectId(questionId) },
+        { "$set": { "message": new_message } }
+    )
+    history_cache.invalidate(sessionId)
+
+
+
+
+##### BOOK OTHER FILES FORMATS SAVING AND RETRIEVING FOR USERS ##########
+# 1. Add a new file (raises DuplicateKeyError if the user already has a file with that name,
+#    QuotaExceededError if it does not fit in the user's quota; 0 means no limit)
+async def add_file(filename, user_id, filesize, file_format, upload_date, sha256=None, blob_path=None,
+                   max_files=0, max_bytes=0):
+    new_file = {
+        "user_id": ObjectId(user_id),
+        "file_name": filename,
+        "size": filesize,
+        "format": file_format,
+        "upload_date": upload_date,
+        "sha256": sha256,
+        "blob_path": blob_path
+    }
+    # The counters are reserved first: concurrent uploads cannot all pass the quota
+    await reserve_usage(user_id, [(file_format, filesize)], max_files, max_bytes)
+    try:
+        result = await books_collection.insert_one(new_file)
+    except BaseException:
+        await increment_usage(user_id, [(file_format, filesize)], sign=-1)
+        raise
+    return str(result.inserted_id)
+
+# 2. Delete a file based on file_id and user_id
+async def delete_mongodb_file(file_id, user_id):
+    deleted = await books_collection.find_one_and_delete(
+        {"_id": ObjectId(file_id), "user_id": ObjectId(user_id)},
+        projection={"size": 1, "format": 1}
+    )
+    if deleted is None:
+        return False
+    await increment_usage(user_id, [(deleted.get("format"), deleted.get("size") or 0)], sign=-1)
+    return True
+
+# 3. Retrieve file detail based on file_id
+async def get_file_detail(file_id):
+    file = await books_collection.find_one({
+        "_id": ObjectId(file_id)
+    })
+    if file:
+        file['_id'] = str(file['_id'])
+        file['user_id'] = str(file['user_id'])
+    return file
+
+# 4. List all file_ids for a given user_id, oldest upload first
+async def list_file_ids_by_user(user_id, limit: int | None = None, cursor: str | None = None):
+    query = {"user_id": ObjectId(user_id), **keyset_filter("upload_date", ASCENDING, cursor)}
+    files = books_collection.find(query).sort([("upload_date", ASCENDING), ("_id", ASCENDING)])
+    if limit:
+        files = files.limit(limit)
+    async for file in files:
+        yield {"_id": str(file['_id']),
+               "file_name": file['file_name'],
+               "file_format": file['format'],
+               "upload_datefile": file['upload_date'],
+               "file_size": file["size"]}
+
+# 5. Find a user's file by id (raw document, used by the download/delete endpoints)
+async def find_user_file(file_id, user_id):
+    return await books_collection.find_one({
+        "_id": ObjectId(file_id),
+        "user_id": ObjectId(user_id)
+    })
+
+# 6. Find a user's file by name (duplicate check on upload)
+async def find_user_file_by_name(filename, user_id):
+    return await books_collection.find_one({
+        "user_id": ObjectId(user_id),
+        "file_name": filename
+    })
+
+# 7. One of the user's files with this content, if any
+async def find_user_file_by_sha256(sha256, user_id):
+    return await books_collection.find_one({"user_id": ObjectId(user_id), "sha256": sha256})
+
+# 8. Names among `filenames` the user already has (one $in query for a whole batch)
+async def find_user_file_names(filenames, user_id):
+    cursor = books_collection.find(
+        {"user_id": ObjectId(user_id), "file_name": {"$in": list(filenames)}},
+        {"file_name": 1, "_id": 0}
+    )
+    return {doc["file_name"] async for doc in cursor}
+
+# 9. Insert many files' metadata in one round trip
+async def add_files(files, user_id, upload_date, max_files=0, max_bytes=0):
+    """
+    Inserts [{"file_name", "size", "format", "sha256", "blob_path"}] for one user.
+    Unordered, so one duplicate name does not stop the rest. Usage for the whole
+    batch is reserved first (QuotaExceededError if it does not fit) and refunded
+    for the entries that were not inserted.
+
+    Returns:
+        list: the new file id of each entry, or None where the name was already taken.
+    """
+    docs = [{
+        "_id": ObjectId(),
+        "user_id": ObjectId(user_id),
+        "file_name": f["file_name"],
+        "size": f["size"],
+        "format": f["format"],
+        "upload_date": upload_date,
+        "sha256": f.get("sha256"),
+        "blob_path": f.get("blob_path")
+    } for f in files]
+    await reserve_usage(user_id, [(doc["format"], doc["size"]) for doc in docs], max_files, max_bytes)
+    failed = set()
+    try:
+        await books_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: every document not listed in writeErrors was inserted
+        errors = e.details.get("writeErrors", [])
+        failed = {error["index"] for error in errors}
+        if any(error.get("code") != 11000 for error in errors):
+            await increment_usage(user_id, [(docs[i]["format"], docs[i]["size"]) for i in failed], sign=-1)
+            raise
+    except BaseException:
+        await increment_usage(user_id, [(doc["format"], doc["size"]) for doc in docs], sign=-1)
+        raise
+    if failed:
+        await increment_usage(user_id, [(docs[i]["format"], docs[i]["size"]) for i in failed], sign=-1)
+    return [None if i in failed else str(doc["_id"]) for i, doc in enumerate(docs)]
+
+
+
+##### CONTENT-ADDRESSED BLOBS (one stored copy per distinct book content) ##########
+# blobs documents: {_id: sha256, path, size, ref_count, state, generation, claimed_at,
+#                   sources: [{url, file_name}], created_at,
+#                   optimized_path, optimized_size, optimized_generation (linearized PDFs, see pdf_optimize.py)}
+# state is "pending" while the upload that created the document writes the object, then "ready".
+# Only ready blobs are shared; documents from before `state` existed count as ready.
+
+# 1. Claim the creation of a blob. Returns False if it already exists or another upload is writing it.
+#    A pending claim older than `stale_after` seconds (its upload died) is taken over, and so is
+#    a blob left with no reference by a release that died before deleting it.
+async def claim_blob(sha256, size, path, source, stale_after):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    update = {"$set": {"path": path, "size": size, "ref_count": 1, "state": "pending", "generation": None,
+                       "claimed_at": now, "created_at": now},
+              "$unset": {"optimized_path": "", "optimized_size": "", "optimized_generation": ""}}
+    if source:
+        update["$addToSet"] = {"sources": source}
+    try:
+        await blobs_collection.update_one(
+            {"_id": sha256, "$or": [
+                {"state": "pending", "claimed_at": {"$lt": now - datetime.timedelta(seconds=stale_after)}},
+                # Left unreferenced by a release interrupted before its delete
+                {"ref_count": {"$lte": 0}},
+            ]},
+            update, upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+# 2. Take a reference on an already stored blob, found by hash or by source URL. Returns None if unknown.
+async def reference_existing_blob(sha256=None, source_url=None, source=None):
+    query = {"ref_count": {"$gte": 1}, "state": {"$ne": "pending"}}
+    if sha256:
+        query["_id"] = sha256
+    elif source_url:
+        query["sources.url"] = source_url
+    else:
+        return None
+    update = {"$inc": {"ref_count": 1}}
+    if source:
+        update["$addToSet"] = {"sources": source}
+    return await blobs_collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+
+# 3. Mark a claimed blob written, with its storage generation (guards deletes against re-creation races)
+async def set_blob_ready(sha256, generation):
+    await blobs_collection.update_one({"_id": sha256}, {"$set": {"state": "ready", "generation": generation}})
+
+async def abandon_blob_claim(sha256):
+    await blobs_collection.delete_one({"_id": sha256, "state": "pending"})
+
+# 4. Drop a reference. Returns the blob document if that was the last one and the blob must be deleted.
+async def release_blob_reference(sha256):
+    blob = await blobs_collection.find_one_and_update(
+        {"_id": sha256}, {"$inc": {"ref_count": -1}}, return_document=ReturnDocument.AFTER
+    )
+    if blob is None or blob["ref_count"] > 0:
+        return None
+    result = await blobs_collection.delete_one({"_id": sha256, "ref_count": {"$lte": 0}})
+    return blob if result.deleted_count else None
+
+# 5. Look up a stored blob
+async def get_blob(sha256, projection=None):
+    return await blobs_collection.find_one({"_id": sha256}, projection)
+
+# 6. Record the web-optimized (linearized) variant of a PDF blob. Returns False if the blob is gone.
+async def set_blob_optimized(sha256, optimized_path, optimized_size, generation):
+    result = await blobs_collection.update_one(
+        {"_id": sha256, "ref_count": {"$gte": 1}},
+        {"$set": {"optimized_path": optimized_path, "optimized_size": optimized_size,
+                  "optimized_generation": generation}}
+    )
+    return result.matched_count > 0
+
+
+
+##### PAGE INDEX (extracted book text, see ingestion.py) ##########
+# page_index documents: {_id: index key, status, pages_total, pages_done, text_path,
+#                        byte_offsets, char_offsets, error, updated_at}
+# Page i spans [byte_offsets[i], byte_offsets[i + 1]) of the stored UTF-8 text.
+
+# 1. Claim an index for building. Returns False if it is already built or being built.
+#    A failed index, or a running one not updated for `stale_after` seconds, is claimed again.
+async def start_page_index(key, stale_after):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stale = now - datetime.timedelta(seconds=stale_after)
+    try:
+        await page_index_collection.update_one(
+            {"_id": key, "$or": [{"status": "failed"}, {"status": "running", "updated_at": {"$lt": stale}}]},
+            {"$set": {"status": "running", "pages_done": 0, "pages_total": None, "error": None, "updated_at": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Document exists and is queued/running/done
+        return False
+    return True
+
+async def update_page_index_progress(key, pages_done, pages_total):
+    await page_index_collection.update_one(
+        {"_id": key},
+        {"$set": {"pages_done": pages_done, "pages_total": pages_total,
+                  "updated_at": datetime.datetime.now(datetime.timezone.utc)}}
+    )
+
+async def finish_page_index(key, text_path, byte_offsets, char_offsets):
+    await page_index_collection.update_one(
+        {"_id": key},
+        {"$set": {"status": "done", "text_path": text_path, "byte_offsets": byte_offsets,
+                  "char_offsets": char_offsets, "pages_done": len(byte_offsets) - 1,
+                  "pages_total": len(byte_offsets) - 1,
+                  "updated_at": datetime.datetime.now(datetime.timezone.utc)}}
+    )
+
+async def fail_page_index(key, error):
+    await page_index_collection.update_one(
+        {"_id": key},
+        {"$set": {"status": "failed", "error": error, "updated_at": datetime.datetime.now(datetime.timezone.utc)}}
+    )
+
+# 2. Index document (offsets are large, leave them out with with_offsets=False)
+async def get_page_index(key, with_offsets=True):
+    projection = None if with_offsets else {"byte_offsets": 0, "char_offsets": 0}
+    return await page_index_collection.find_one({"_id": key}, projection)
+
+async def delete_page_index(key):
+    return await page_index_collection.find_one_and_delete({"_id": key})
+
+
+
+##### PER-USER STORAGE USAGE ##########
+# user_usage documents: {_id: user ObjectId, file_count, total_bytes,
+#                        formats: {<format>: {"files", "bytes"}}, updated_at}
+# Maintained with $inc next to every insert/delete of uploaded_files, so a user's
+# library size is one point read. reconcile_usage rebuilds them from the files.
+
+def _usage_increments(files, sign=1):
+    increments = {"file_count": 0, "total_bytes": 0}
+    for file_format, size in files:
+        file_format = file_format or "unknown"
+        increments["file_count"] += sign
+        increments["total_bytes"] += sign * size
+        increments[f"formats.{file_format}.files"] = increments.get(f"formats.{file_format}.files", 0) + sign
+        increments[f"formats.{file_format}.bytes"] = increments.get(f"formats.{file_format}.bytes", 0) + sign * size
+    return increments
+
+class QuotaExceededError(Exception):
+    """Raised when new files do not fit in a user's file or byte quota."""
+
+# 1. Add (sign=1) or remove (sign=-1) files [(format, size)] from a user's counters
+async def increment_usage(user_id, files, sign=1):
+    await usage_collection.update_one(
+        {"_id": ObjectId(user_id)},
+        {"$inc": _usage_increments(files, sign), "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+        upsert=True
+    )
+
+# 2. Add files to a user's counters only if they stay within the quota (0 means no limit).
+#    The conditional $inc is the enforcement point: one round trip, atomic against concurrent uploads.
+async def reserve_usage(user_id, files, max_files=0, max_bytes=0):
+    increments = _usage_increments(files)
+    conditions = []
+    for field, limit in (("file_count", max_files), ("total_bytes", max_bytes)):
+        if not limit:
+            continue
+        if increments[field] > limit:
+            raise QuotaExceededError(f"Storage quota exceeded: at most {limit} {field.split('_')[-1]}.")
+        conditions.append({"$or": [{field: {"$lte": limit - increments[field]}}, {field: {"$exists": False}}]})
+    query = {"_id": ObjectId(user_id)}
+    if conditions:
+        query["$and"] = conditions
+    try:
+        await usage_collection.update_one(
+            query,
+            {"$inc": increments, "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The counters exist but do not match the conditions
+        raise QuotaExceededError("Storage quota exceeded.")
+
+# 3. Current counters of a user (zeros if they never uploaded anything)
+async def get_user_usage(user_id):
+    usage = await usage_collection.find_one({"_id": ObjectId(user_id)})
+    if usage is None:
+        return {"file_count": 0, "total_bytes": 0, "formats": {}}
+    return {"file_count": usage.get("file_count", 0), "total_bytes": usage.get("total_bytes", 0),
+            "formats": usage.get("formats", {})}
+
+# 4. Rebuild every user's counters from uploaded_files, `batch_size` users at a time
+async def _file_owner_ids(after, limit):
+    # Index-backed distinct walk over uploaded_files.user_id: one short lookup per owner
+    owners = []
+    while len(owners) < limit:
+        query = {"user_id": {"$gt": after}} if after is not None else {}
+        doc = await books_collection.find_one(query, {"user_id": 1, "_id": 0}, sort=[("user_id", ASCENDING)])
+        if doc is None:
+            break
+        after = doc["user_id"]
+        owners.append(after)
+    return owners
+
+async def reconcile_usage(batch_size):
+    """
+    Walks every user id that owns files or already has counters (whether or not
+    it has a users document), in order; for each batch, one aggregation (on the
+    user_id index prefix) sums their files and one bulk write replaces their counters.
+    Uploads racing with a batch can be off until the next run.
+
+    Returns:
+        int: number of users reconciled.
+    """
+    last_id = None
+    reconciled = 0
+    while True:
+        # The batch_size smallest ids after last_id among both sources
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        counted = [doc["_id"] async for doc in
+                   usage_collection.find(query, {"_id": 1}).sort("_id", ASCENDING).limit(batch_size)]
+        user_ids = sorted(set(counted) | set(await _file_owner_ids(last_id, batch_size)))[:batch_size]
+        if not user_ids:
+            return reconciled
+        totals = {user_id: {"file_count": 0, "total_bytes": 0, "formats": {}} for user_id in user_ids}
+        pipeline = [
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$group": {"_id": {"user_id": "$user_id", "format": "$format"},
+                        "files": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$size", 0]}}}},
+        ]
+        async for row in books_collection.aggregate(pipeline):
+            usage = totals[row["_id"]["user_id"]]
+            usage["file_count"] += row["files"]
+            usage["total_bytes"] += row["bytes"]
+            usage["formats"][row["_id"].get("format") or "unknown"] = {"files": row["files"], "bytes": row["bytes"]}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        await usage_collection.bulk_write(
+            [ReplaceOne({"_id": user_id}, {**usage, "updated_at": now}, upsert=True) for user_id, usage in totals.items()],
+            ordered=False
+        )
+        reconciled += len(user_ids)
+        last_id = user_ids[-1]
+
+
+
+##### LIBGEN IMPORT JOBS ##########
+# import_jobs documents: {_id, user_id, book_detail_url, state, active, bytes_downloaded,
+#                         bytes_total, result, error, status_code, created_at, updated_at, finished_at}
+# state: queued -> resolving -> downloading -> storing -> done | failed.
+# `active` is true until the job finishes; a partial unique index on (user_id, book_detail_url)
+# over active jobs keeps a single import of a URL per user in flight.
+
+# 1. Create an import job, or return the user's active job for the same URL.
+async def create_import_job(user_id, book_detail_url, stale_after):
+    """
+    A running job whose document has not been touched for `stale_after` seconds
+    (its worker died with the process) is failed and replaced by a new one.
+
+    Returns:
+        (dict, bool): the job document and whether it was created by this call.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    job = {"user_id": ObjectId(user_id), "book_detail_url": book_detail_url, "state": "queued", "active": True,
+           "bytes_downloaded": 0, "bytes_total": None, "result": None, "error": None, "status_code": None,
+           "created_at": now, "updated_at": now, "finished_at": None}
+    for _ in range(2):
+        try:
+            result = await import_jobs_collection.insert_one(dict(job))
+            return {**job, "_id": result.inserted_id}, True
+        except DuplicateKeyError:
+            existing = await import_jobs_collection.find_one(
+                {"user_id": job["user_id"], "book_detail_url": book_detail_url, "active": True})
+            if existing is None:
+                continue  # Finished in between
+            if existing["updated_at"].replace(tzinfo=datetime.timezone.utc) > now - datetime.timedelta(seconds=stale_after):
+                return existing, False
+            await finish_import_job(existing["_id"], "failed", {"error": "Import interrupted.", "status_code": 500})
+    raise RuntimeError("Could not create the import job.")
+
+async def start_import_job(job_id):
+    """Marks a queued job as picked up by a worker. False if it was failed as stale (and replaced) meanwhile."""
+    result = await import_jobs_collection.update_one(
+        {"_id": job_id, "active": True},
+        {"$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)}}
+    )
+    return result.matched_count > 0
+
+async def update_import_job(job_id, fields):
+    await import_jobs_collection.update_one(
+        {"_id": job_id, "active": True},
+        {"$set": {**fields, "updated_at": datetime.datetime.now(datetime.timezone.utc)}}
+    )
+
+async def finish_import_job(job_id, state, fields):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await import_jobs_collection.update_one(
+        {"_id": job_id, "active": True},
+        {"$set": {**fields, "state": state, "active": False, "updated_at": now, "finished_at": now}}
+    )
+
+# 2. A user's import job (None for unknown or malformed ids)
+async def get_import_job(job_id, user_id):
+    if not ObjectId.is_valid(job_id) or not ObjectId.is_valid(user_id):
+        return None
+    return await import_jobs_collection.find_one({"_id": ObjectId(job_id), "user_id": ObjectId(user_id)})
@@ -0,0 +1,96 @@
+"""
+Linearized ("fast web view") copies of uploaded PDFs.
+
+A linearized PDF starts with the objects of its first page and a first-page
+cross-reference table, so pdf.js can render page one from the first range
+requests instead of fetching the trailer at the end of the file and then
+jumping around it. After upload, optimize_pdf rewrites the PDF with pikepdf
+(or the qpdf command when pikepdf is not installed) and stores the result
+next to the original as blobs/<sha256>.linearized.pdf. The original is kept
+untouched: its hash is the content identity. /generate-link/ links to the
+optimized copy when there is one.
+"""
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+from mongo_apis_async import get_blob, set_blob_optimized
+from storage import get_storage
+from ingestion import get_process_pool
+from library import content_blob_path
+
+LINEARIZED_SUFFIX = ".linearized.pdf"
+
+
+class LinearizationUnavailable(Exception):
+    """Raised when neither pikepdf nor qpdf is available."""
+
+
+def optimized_blob_path(sha256: str) -> str:
+    return content_blob_path(sha256) + LINEARIZED_SUFFIX
+
+def is_linearized(path: str) -> bool:
+    # The linearization dictionary is the first object of the file
+    with open(path, "rb") as f:
+        return b"/Linearized" in f.read(1024)
+
+def linearize_pdf(src: str, dst: str):
+    """Writes a linearized copy of `src` to `dst` (runs in worker processes)."""
+    try:
+        import pikepdf
+    except ImportError:
+        pikepdf = None
+    if pikepdf is not None:
+        with pikepdf.open(src) as pdf:
+            pdf.save(dst, linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        return
+    if shutil.which("qpdf") is None:
+        raise LinearizationUnavailable("Install pikepdf or qpdf to linearize PDFs.")
+    # qpdf exits with 3 for warnings, the output is still written
+    result = subprocess.run(["qpdf", "--linearize", "--object-streams=generate", src, dst], capture_output=True)
+    if result.returncode not in (0, 3):
+        raise RuntimeError(result.stderr.decode(errors="replace").strip())
+
+async def optimize_pdf(sha256: str):
+    """
+    Stores a linearized variant of the PDF blob `sha256` unless it already has one.
+    Returns the optimized path, or None if the blob is gone.
+    """
+    blob = await get_blob(sha256, {"path": 1, "optimized_path": 1})
+    if blob is None:
+        return None
+    if blob.get("optimized_path"):
+        return blob["optimized_path"]
+
+    storage = get_storage()
+    loop = asyncio.get_running_loop()
+    async with storage.local_copy(blob["path"]) as local_path:
+        if is_linearized(local_path):
+            # Already web-optimized: the original is the optimized variant
+            size = os.path.getsize(local_path)
+            await set_blob_optimized(sha256, blob["path"], size, None)
+            return blob["path"]
+        fd, linearized_path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        try:
+            await loop.run_in_executor(get_process_pool(), linearize_pdf, local_path, linearized_path)
+            size = os.path.getsize(linearized_path)
+            path = optimized_blob_path(sha256)
+            with open(linearized_path, "rb") as f:
+                generation = await storage.upload_file_object(path, f, "application/pdf")
+        finally:
+            os.remove(linearized_path)
+
+    if not await set_blob_optimized(sha256, path, size, generation):
+        # The last reference was dropped meanwhile
+        await storage.delete(path, generation)
+        return None
+    return path
+
+async def preferred_blob_path(file_doc: dict, default_path: str) -> str:
+    """Path to link to for a user file: the linearized PDF when available."""
+    if not file_doc.get("sha256") or not file_doc.get("blob_path"):
+        return default_path
+    blob = await get_blob(file_doc["sha256"], {"optimized_path": 1})
+    return (blob or {}).get("optimized_path") or default_path
@@ -0,0 +1,30 @@
+"""
+Rebuilds the per-user storage counters (user_usage) from uploaded_files.
+
+The API keeps the counters up to date with $inc on every upload and delete;
+this repairs any drift (crashes between the two writes, manual edits, files
+stored before the counters existed). Every user id found in uploaded_files or
+user_usage is processed, in batches of USAGE_RECONCILE_BATCH_SIZE, one
+aggregation and one bulk write per batch.
+
+Usage (from fastapi_backend/):
+    python reconcile_usage.py
+"""
+import asyncio
+import time
+from config import USAGE_RECONCILE_BATCH_SIZE
+from mongo_apis_async import init_mongo, close_mongo, reconcile_usage
+
+
+async def main():
+    init_mongo()
+    start = time.perf_counter()
+    try:
+        count = await reconcile_usage(USAGE_RECONCILE_BATCH_SIZE)
+    finally:
+        await close_mongo()
+    print(f"Reconciled usage of {count} users in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,291 @@
+"""
+Per-book retrieval index for book-grounded chat.
+
+Once a book's page index exists (see ingestion.py), its text is split into
+overlapping chunks within each page and every chunk is embedded. The
+L2-normalized vectors are stored as one float32 matrix per book and opened
+with np.memmap, so a query is a single matrix-vector product (cosine
+similarity) followed by a partial sort for the top k; only the pages touched
+are read from disk. Indexes are keyed like page indexes (content hash):
+  <key>/vectors.f32   float32 matrix, one row per chunk
+  <key>/chunks.json   embedder name, dimension and the chunks (page, char span, text)
+The storage backend holds the index under retrieval_index/<key>/, so a book is
+embedded once for all replicas. Each replica memmaps a local copy under
+RETRIEVAL_INDEX_DIR, fetched from storage on first use.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+from collections import OrderedDict
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from mongo_apis_async import get_page_index
+from storage import get_storage
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STORAGE_PREFIX = "retrieval_index/"
+INDEX_FILES = ("vectors.f32", "chunks.json")  # chunks.json last: it marks a complete index
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder: hashed bag of words and word bigrams, signed and
+    L2-normalized. Needs no API and no model; used offline and in benchmarks.
+    """
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _embed_sync(self, texts: list) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                matrix[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return matrix
+
+    async def embed(self, texts: list) -> np.ndarray:
+        return await run_in_threadpool(self._embed_sync, texts)
+
+
+class OpenAIEmbedder:
+    """Embeddings API through the shared LLMClient (pooling, concurrency caps, retries)."""
+    def __init__(self, llm, model: str):
+        self.llm = llm
+        self.model = model
+        self.name = f"openai-{model}"
+
+    async def embed(self, texts: list) -> np.ndarray:
+        return np.asarray(await self.llm.embed(texts, self.model), dtype=np.float32)
+
+
+def make_embedder(backend: str, llm, model: str, dim: int):
+    if backend == "openai":
+        return OpenAIEmbedder(llm, model)
+    if backend == "hashing":
+        return HashingEmbedder(dim)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}, expected 'openai' or 'hashing'.")
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def chunk_pages(pages: list, chunk_chars: int, overlap: int) -> list:
+    """Splits each page into overlapping chunks: [{"page", "char_start", "char_end", "text"}]."""
+    step = max(1, chunk_chars - overlap)
+    chunks = []
+    for page, text in enumerate(pages):
+        start = 0
+        while start < len(text):
+            end = min(start + chunk_chars, len(text))
+            if end < len(text):
+                # Cut at the last whitespace of the window rather than inside a word
+                cut = text.rfind(" ", start + step, end)
+                end = cut if cut > start else end
+            piece = text[start:end].strip()
+            if piece:
+                chunks.append({"page": page, "char_start": start, "char_end": end, "text": piece})
+            if end >= len(text):
+                break
+            # The overlap also starts on a word boundary
+            next_start = max(end - overlap, start + 1)
+            space = text.find(" ", next_start, end)
+            start = space + 1 if space != -1 else next_start
+    return chunks
+
+def write_json(path: str, value):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+
+def top_k(matrix: np.ndarray, query: np.ndarray, k: int):
+    """Indices and scores of the k rows of `matrix` most similar to `query`, best first."""
+    scores = matrix @ query
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return best, scores[best]
+
+
+class VectorIndexStore:
+    """
+    Builds, opens and searches the per-book vector indexes under `root`.
+
+    Attributes:
+        embedder: HashingEmbedder or OpenAIEmbedder; indexes built by another embedder are rebuilt.
+        chunk_chars, overlap: Chunk size and overlap in characters.
+        batch_size: Chunks embedded per call.
+        max_open: Opened indexes (memmap + chunk list) kept in an LRU.
+
+    File I/O runs in the threadpool; the LRU is only touched on the event loop.
+    """
+    def __init__(self, root: str, embedder, chunk_chars: int, overlap: int, batch_size: int, max_open: int):
+        self.root = os.path.abspath(root)
+        self.embedder = embedder
+        self.chunk_chars = chunk_chars
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._changes = 0  # Bumped whenever a local index is replaced or removed
+        self.searches = 0
+        self.builds = 0
+
+    def index_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @staticmethod
+    def storage_path(key: str, name: str) -> str:
+        return f"{STORAGE_PREFIX}{key}/{name}"
+
+    def _read_meta(self, key: str):
+        try:
+            with open(os.path.join(self.index_dir(key), "chunks.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        return meta if meta["embedder"] == self.embedder.name else None
+
+    def has_index(self, key: str) -> bool:
+        return self._read_meta(key) is not None
+
+    def _install(self, key: str, part_dir: str):
+        final_dir = self.index_dir(key)
+        if os.path.isdir(final_dir):
+            # Left by another embedder
+            shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(part_dir, final_dir)
+
+    def _new_part_dir(self, key: str) -> str:
+        # Files are written next to the final directory and moved in place once complete
+        part_dir = f"{self.index_dir(key)}.part-{uuid.uuid4().hex}"
+        os.makedirs(part_dir)
+        return part_dir
+
+    async def _fetch(self, key: str) -> bool:
+        """Copies the index of `key` from the storage backend, if it has one built by our embedder."""
+        storage = get_storage()
+        if not await storage.exists(self.storage_path(key, "chunks.json")):
+            return False
+        part_dir = await run_in_threadpool(self._new_part_dir, key)
+        try:
+            for name in INDEX_FILES:
+                async with storage.local_copy(self.storage_path(key, name)) as local_path:
+                    await run_in_threadpool(shutil.copyfile, local_path, os.path.join(part_dir, name))
+            await run_in_threadpool(self._install, key, part_dir)
+        except BaseException:
+            await run_in_threadpool(shutil.rmtree, part_dir, True)
+            raise
+        self._forget(key)
+        return await run_in_threadpool(self.has_index, key)
+
+    async def _publish(self, key: str):
+        storage = get_storage()
+        for name in INDEX_FILES:
+            f = await run_in_threadpool(open, os.path.join(self.index_dir(key), name), "rb")
+            try:
+                await storage.upload_file_object(self.storage_path(key, name), f, "application/octet-stream")
+            finally:
+                await run_in_threadpool(f.close)
+
+    async def build(self, key: str):
+        """
+        Embeds the page index of `key` into a vector index, one batch at a time,
+        unless it is already built locally or in the storage backend.
+        Returns False when the page index is not finished yet (nothing to build).
+        """
+        if await run_in_threadpool(self.has_index, key) or await self._fetch(key):
+            return True
+        index = await get_page_index(key)
+        if index is None or index["status"] != "done":
+            return False
+        offsets = index["byte_offsets"]
+        data = await get_storage().read_range(index["text_path"], 0, offsets[-1])
+        pages = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        chunks = chunk_pages(pages, self.chunk_chars, self.overlap)
+
+        part_dir = await run_in_threadpool(self._new_part_dir, key)
+        try:
+            dim = None
+            f = await run_in_threadpool(open, os.path.join(part_dir, "vectors.f32"), "wb")
+            try:
+                for start in range(0, len(chunks), self.batch_size):
+                    batch = [chunk["text"] for chunk in chunks[start:start + self.batch_size]]
+                    vectors = normalize_rows(await self.embedder.embed(batch)).astype(np.float32)
+                    dim = vectors.shape[1]
+                    await run_in_threadpool(f.write, vectors.tobytes())
+            finally:
+                await run_in_threadpool(f.close)
+            meta = {"embedder": self.embedder.name, "dim": dim, "count": len(chunks), "chunks": chunks}
+            await run_in_threadpool(write_json, os.path.join(part_dir, "chunks.json"), meta)
+            await run_in_threadpool(self._install, key, part_dir)
+        except BaseException:
+            await run_in_threadpool(shutil.rmtree, part_dir, True)
+            raise
+        self._forget(key)
+        await self._publish(key)
+        self.builds += 1
+        return True
+
+    def _forget(self, key: str):
+        self._open.pop(key, None)
+        self._changes += 1
+
+    def _open_index(self, key: str):
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        if meta["count"] == 0:
+            matrix = np.empty((0, meta["dim"] or 0), dtype=np.float32)
+        else:
+            matrix = np.memmap(os.path.join(self.index_dir(key), "vectors.f32"), dtype=np.float32, mode="r",
+                               shape=(meta["count"], meta["dim"]))
+        return matrix, meta["chunks"]
+
+    async def _load(self, key: str):
+        if key in self._open:
+            self._open.move_to_end(key)
+            return self._open[key]
+        changes = self._changes
+        loaded = await run_in_threadpool(self._open_index, key)
+        # Not cached if the index was replaced or removed while it was being opened
+        if loaded is not None and changes == self._changes:
+            self._open[key] = loaded
+            if len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return loaded
+
+    async def search(self, key: str, query: str, k: int):
+        """Top-k chunks of the book for `query` ([{"page", "score", "text"}]), or None if it has no index."""
+        loaded = await self._load(key)
+        if loaded is None and await self._fetch(key):
+            loaded = await self._load(key)
+        if loaded is None:
+            return None
+        matrix, chunks = loaded
+        self.searches += 1
+        if not chunks:
+            return []
+        vector = normalize_rows(await self.embedder.embed([query]))[0].astype(np.float32)
+        best, scores = await run_in_threadpool(top_k, matrix, vector, k)
+        return [{"page": chunks[i]["page"], "score": round(float(score), 4), "text": chunks[i]["text"]}
+                for i, score in zip(best.tolist(), scores.tolist())]
+
+    async def remove(self, key: str):
+        """Deletes the index from the storage backend and the local copy of this replica."""
+        self._forget(key)
+        for name in reversed(INDEX_FILES):
+            await get_storage().delete(self.storage_path(key, name))
+        await run_in_threadpool(shutil.rmtree, self.index_dir(key), True)
+        self._forget(key)  # In case a search opened it meanwhile
+
+    def stats(self) -> dict:
+        return {"embedder": self.embedder.name, "open_indexes": len(self._open),
+                "builds": self.builds, "searches": self.searches}
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class SearchCache:
+    """
+    Stale-while-revalidate LRU cache in front of the LibGen search.
+
+    Entries are keyed on the normalized book name and keep the results of the
+    largest `number` fetched so far, so a search for fewer results is served
+    from a slice of it. Within `ttl` an entry is fresh; for `stale_ttl` more it
+    is still served while one background refresh fetches it again. Concurrent
+    misses for the same name share one upstream fetch.
+
+    Attributes:
+        fetch: `await fetch(book_name, number)` -> list of results.
+        max_entries: Names kept before the least recently used is evicted.
+        ttl: Seconds an entry is fresh.
+        stale_ttl: Seconds after `ttl` during which a stale entry is still served.
+    """
+    def __init__(self, fetch, max_entries: int, ttl: float, stale_ttl: float):
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # name -> (number requested, results, fetched_at)
+        self._entries = OrderedDict()
+        # name -> (number, task) of the fetch in flight
+        self._inflight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    @staticmethod
+    def normalize(book_name: str) -> str:
+        return " ".join(book_name.lower().split())
+
+    @staticmethod
+    def _covers(number: int, results: list, wanted: int) -> bool:
+        # Fewer results than requested means the search returned everything there is
+        return number >= wanted or len(results) < number
+
+    def _store(self, name: str, number: int, results: list):
+        current = self._entries.get(name)
+        if current is not None and current[0] > number and time.monotonic() - current[2] < self.ttl:
+            # Keep the larger fresh result set
+            return
+        self._entries[name] = (number, results, time.monotonic())
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _start_fetch(self, name: str, book_name: str, number: int) -> asyncio.Task:
+        async def run():
+            try:
+                results = await self.fetch(book_name, number)
+                self._store(name, number, results)
+                return results
+            finally:
+                if self._inflight.get(name, (None, None))[1] is task:
+                    del self._inflight[name]
+
+        task = asyncio.ensure_future(run())
+        self._inflight[name] = (number, task)
+        return task
+
+    def _refresh(self, name: str, book_name: str, number: int):
+        if name in self._inflight:
+            return
+        self.refreshes += 1
+        task = self._start_fetch(name, book_name, number)
+
+        def done(t):
+            if not t.cancelled() and t.exception() is not None:
+                self.refresh_errors += 1
+
+        task.add_done_callback(done)
+
+    async def get(self, book_name: str, number: int) -> list:
+        name = self.normalize(book_name)
+        entry = self._entries.get(name)
+        if entry is not None and self._covers(entry[0], entry[1], number):
+            cached_number, results, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return results[:number]
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(name)
+                self.stale_hits += 1
+                self._refresh(name, book_name, cached_number)
+                return results[:number]
+
+        inflight = self._inflight.get(name)
+        if inflight is not None and inflight[0] >= number:
+            self.coalesced += 1
+            results = await asyncio.shield(inflight[1])
+            return results[:number]
+        self.misses += 1
+        results = await asyncio.shield(self._start_fetch(name, book_name, number))
+        return results[:number]
+
+    async def close(self):
+        for _, task in list(self._inflight.values()):
+            task.cancel()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "hit_rate": round((self.hits + self.stale_hits + self.coalesced) / lookups, 4) if lookups else None,
+        }
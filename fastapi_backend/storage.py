@@ -0,0 +1,300 @@
+"""
+Storage backends for book bytes.
+
+Every storage operation of the API goes through a StorageBackend:
+  - GCSStorage keeps objects in the books bucket and links to them with V4 signed URLs.
+  - LocalStorage keeps them under a local directory and links to them with
+    HMAC-signed URLs served by the /files/ endpoint (HTTP Range, zero-copy when
+    the ASGI server supports it). It lets the whole backend run offline.
+The backend is picked with STORAGE_BACKEND ("gcs" or "local").
+"""
+import datetime
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+from starlette.concurrency import run_in_threadpool
+from config import (GCS_CREDENTIALS_FILE, GCS_BUCKET_NAME, STORAGE_BACKEND, LOCAL_STORAGE_DIR,
+                    LOCAL_STORAGE_SECRET, PUBLIC_BASE_URL)
+
+_bucket = None
+_storage = None
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload grows past the configured maximum size."""
+
+
+def get_bucket():
+    """
+    Returns the books bucket, creating the GCS client on first use.
+    Neither importing the app nor starting it needs GCS credentials.
+    """
+    global _bucket
+    if _bucket is None:
+        # Imported here: google.cloud.storage is one of the slowest imports of the app
+        from google.cloud import storage
+        gcs_client = storage.Client.from_service_account_json(GCS_CREDENTIALS_FILE)
+        _bucket = gcs_client.bucket(GCS_BUCKET_NAME)
+    return _bucket
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_SECRET, PUBLIC_BASE_URL)
+        elif STORAGE_BACKEND == "gcs":
+            _storage = GCSStorage()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, expected 'gcs' or 'local'.")
+    return _storage
+
+
+class StorageBackend:
+    """
+    Interface of a book storage backend. Paths are '/'-separated object names.
+
+    Each stored object has a generation that changes whenever it is rewritten;
+    delete() can be made conditional on it so a concurrent rewrite survives.
+    """
+    async def upload_stream(self, path: str, read_chunk, content_type: str, max_bytes: int, chunk_size: int):
+        """
+        Streams `read_chunk(chunk_size)` (b"" at the end) into `path`, one chunk at a time.
+        Nothing is stored unless the whole stream was written.
+
+        Returns:
+            tuple: (size in bytes, hex SHA-256 of the content).
+        """
+        raise NotImplementedError
+
+    async def upload_file_object(self, path: str, file_object, content_type: str):
+        """Stores a readable file object at `path` and returns the new generation."""
+        raise NotImplementedError
+
+    async def promote(self, src: str, dst: str):
+        """Moves an object to its final path and returns the generation of `dst`."""
+        raise NotImplementedError
+
+    async def delete(self, path: str, generation=None):
+        """Deletes `path` (only at `generation` if given). Missing objects are ignored."""
+        raise NotImplementedError
+
+    async def exists(self, path: str) -> bool:
+        raise NotImplementedError
+
+    async def generate_url(self, path: str, expires_in: int, media_type: str | None = None) -> str:
+        """Temporary GET link to the object, valid for `expires_in` seconds, served as `media_type` if given."""
+        raise NotImplementedError
+
+    async def read_range(self, path: str, start: int, end: int) -> bytes:
+        """Bytes [start, end) of the object."""
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def local_copy(self, path: str):
+        """Yields a local filesystem path holding the object's content."""
+        raise NotImplementedError
+        yield
+
+
+class GCSStorage(StorageBackend):
+    """Google Cloud Storage backend; all blocking client calls run in the threadpool."""
+
+    @property
+    def bucket(self):
+        return get_bucket()
+
+    async def upload_stream(self, path, read_chunk, content_type, max_bytes, chunk_size):
+        # Resumable upload: memory stays around one chunk (a multiple of 256 KiB); on any
+        # error the resumable session is cancelled so no partial object is committed
+        blob = self.bucket.blob(path)
+        digest = hashlib.sha256()
+        size = 0
+        blob.chunk_size = chunk_size
+        writer = await run_in_threadpool(blob.open, "wb", content_type=content_type)
+        try:
+            while True:
+                chunk = await read_chunk(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(f"File exceeds the maximum size of {max_bytes} bytes.")
+                digest.update(chunk)
+                await run_in_threadpool(writer.write, chunk)
+            await run_in_threadpool(writer.close)
+        except BaseException:
+            await run_in_threadpool(writer.terminate)
+            raise
+        return size, digest.hexdigest()
+
+    async def upload_file_object(self, path, file_object, content_type):
+        blob = self.bucket.blob(path)
+        await run_in_threadpool(blob.upload_from_file, file_object, content_type=content_type)
+        return blob.generation
+
+    async def promote(self, src, dst):
+        # Server-side copy, no bytes go through the API
+        stored = await run_in_threadpool(self.bucket.copy_blob, self.bucket.blob(src), self.bucket, dst)
+        await self.delete(src)
+        return stored.generation
+
+    async def delete(self, path, generation=None):
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        kwargs = {"if_generation_match": generation} if generation else {}
+        try:
+            await run_in_threadpool(self.bucket.blob(path).delete, **kwargs)
+        except (NotFound, PreconditionFailed):
+            pass
+
+    async def exists(self, path):
+        return await run_in_threadpool(self.bucket.blob(path).exists)
+
+    async def generate_url(self, path, expires_in, media_type=None):
+        return await run_in_threadpool(
+            self.bucket.blob(path).generate_signed_url,
+            version="v4",
+            expiration=datetime.timedelta(seconds=expires_in),
+            method="GET",
+            response_type=media_type
+        )
+
+    async def read_range(self, path, start, end):
+        if end <= start:
+            return b""
+        # GCS ranges are inclusive
+        return await run_in_threadpool(self.bucket.blob(path).download_as_bytes, start=start, end=end - 1)
+
+    @asynccontextmanager
+    async def local_copy(self, path):
+        fd, local_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+        os.close(fd)
+        try:
+            await run_in_threadpool(self.bucket.blob(path).download_to_filename, local_path)
+            yield local_path
+        finally:
+            os.remove(local_path)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Local-filesystem backend rooted at `root`. Generations are file mtimes in
+    nanoseconds. Links point at the /files/ endpoint and carry an expiry and an
+    HMAC signature made with `secret`, which must be shared by all workers.
+    """
+    def __init__(self, root: str, secret: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.secret = secret.encode()
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def full_path(self, path: str) -> str:
+        full = os.path.normpath(os.path.join(self.root, path))
+        if not full.startswith(self.root + os.sep):
+            raise ValueError("Path escapes the storage root.")
+        return full
+
+    def _generation(self, full: str) -> int:
+        return os.stat(full).st_mtime_ns
+
+    async def upload_stream(self, path, read_chunk, content_type, max_bytes, chunk_size):
+        full = self.full_path(path)
+        part = f"{full}.part-{uuid.uuid4().hex}"
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        f = await run_in_threadpool(open, part, "wb")
+        try:
+            while True:
+                chunk = await read_chunk(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(f"File exceeds the maximum size of {max_bytes} bytes.")
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+            await run_in_threadpool(f.close)
+            os.replace(part, full)
+        except BaseException:
+            f.close()
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        return size, digest.hexdigest()
+
+    async def upload_file_object(self, path, file_object, content_type):
+        full = self.full_path(path)
+        part = f"{full}.part-{uuid.uuid4().hex}"
+
+        def write():
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(part, "wb") as f:
+                shutil.copyfileobj(file_object, f)
+            os.replace(part, full)
+            return self._generation(full)
+
+        try:
+            return await run_in_threadpool(write)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+    async def promote(self, src, dst):
+        src_full, dst_full = self.full_path(src), self.full_path(dst)
+
+        def move():
+            os.makedirs(os.path.dirname(dst_full), exist_ok=True)
+            os.replace(src_full, dst_full)
+            # A fresh mtime makes the generation of the promoted object unique
+            os.utime(dst_full)
+            return self._generation(dst_full)
+
+        return await run_in_threadpool(move)
+
+    async def delete(self, path, generation=None):
+        full = self.full_path(path)
+
+        def remove():
+            try:
+                if generation and self._generation(full) != generation:
+                    return
+                os.remove(full)
+            except FileNotFoundError:
+                pass
+
+        await run_in_threadpool(remove)
+
+    async def exists(self, path):
+        return os.path.isfile(self.full_path(path))
+
+    def sign(self, path: str, expires: int, media_type: str | None = None) -> str:
+        return hmac.new(self.secret, f"{path}\n{expires}\n{media_type or ''}".encode(), hashlib.sha256).hexdigest()
+
+    def verify(self, path: str, expires: int, signature: str, media_type: str | None = None) -> bool:
+        return expires >= time.time() and hmac.compare_digest(self.sign(path, expires, media_type), signature)
+
+    async def generate_url(self, path, expires_in, media_type=None):
+        expires = int(time.time()) + expires_in
+        url = f"{self.base_url}/files/{quote(path)}?expires={expires}&sig={self.sign(path, expires, media_type)}"
+        return f"{url}&type={quote(media_type, safe='')}" if media_type else url
+
+    async def read_range(self, path, start, end):
+        full = self.full_path(path)
+
+        def read():
+            with open(full, "rb") as f:
+                f.seek(start)
+                return f.read(max(0, end - start))
+
+        return await run_in_threadpool(read)
+
+    @asynccontextmanager
+    async def local_copy(self, path):
+        yield self.full_path(path)
@@ -2,31 +2,12 @@ import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from io import BytesIO
+from config import LIBGEN_SEARCH_URL
+from libgen_client import libgen_search_params, download_filename
 
-def fetch_libgen_books(book_name: str, num: int):
-    """
-    Searches LibGen for a given book and returns a list of book titles and their links.
-
-    Args:
-        book_name (str): The book title to search for.
-
-    Returns:
-        list of dict: A list of dictionaries with 'title' and 'link'.
-    """
-    base_url = "https://libgen.is/search.php"
-    params = {
-        "req": book_name,
-        "open": "0",
-        "res": num,
-        "view": "simple",
-        "phrase": "1",
-        "column": "def"
-    }
-
-    response = requests.get(base_url, params=params)
-    response.raise_for_status()
-
-    soup = BeautifulSoup(response.text, 'html.parser')
+def parse_libgen_search(html: str):
+    """Book titles and detail links of a LibGen search results page."""
+    soup = BeautifulSoup(html, 'html.parser')
     results_table = soup.find('table', {'class': 'c'})
 
     books = []
@@ -43,26 +24,17 @@ def fetch_libgen_books(book_name: str, num: int):
                     books.append({'title': title, 'link': link})
     return books
 
-
-
-def download_libgen_file(book_detail_url: str) -> list[BytesIO, str]:
-    """
-    Downloads the file from LibGen and returns it as BytesIO along with a filename.
-    """
-    response = requests.get(book_detail_url)
-    response.raise_for_status()
-    soup = BeautifulSoup(response.text, 'html.parser')
-
+def parse_mirror_link(html: str, book_detail_url: str) -> str:
+    """URL of the 'Libgen & IPFS & Tor' mirror page linked from a book detail page."""
+    soup = BeautifulSoup(html, 'html.parser')
     mirror_link_tag = soup.find('a', string=lambda text: text and "Libgen & IPFS & Tor" in text)
     if not mirror_link_tag:
         raise ValueError("Mirror link 'Libgen & IPFS & Tor' not found.")
+    return urljoin(book_detail_url, mirror_link_tag['href'])
 
-    mirror_url = urljoin(book_detail_url, mirror_link_tag['href'])
-
-    mirror_response = requests.get(mirror_url)
-    mirror_response.raise_for_status()
-    mirror_soup = BeautifulSoup(mirror_response.text, 'html.parser')
-
+def parse_download_link(html: str) -> str:
+    """Direct download URL (the GET link) of a mirror page."""
+    mirror_soup = BeautifulSoup(html, 'html.parser')
     download_div = mirror_soup.find('div', id='download')
     if not download_div:
         raise ValueError("<div id='download'> not found in mirror page.")
@@ -70,26 +42,42 @@ def download_libgen_file(book_detail_url: str) -> list[BytesIO, str]:
     get_link_tag = download_div.find('a', string="GET")
     if not get_link_tag:
         raise ValueError("GET download link not found.")
+    return get_link_tag['href']
+
+def fetch_libgen_books(book_name: str, num: int):
+    """
+    Searches LibGen for a given book and returns a list of book titles and their links.
+    Blocking; the API uses the pooled async client in libgen_client.py.
+
+    Args:
+        book_name (str): The book title to search for.
+
+    Returns:
+        list of dict: A list of dictionaries with 'title' and 'link'.
+    """
+    response = requests.get(LIBGEN_SEARCH_URL, params=libgen_search_params(book_name, num))
+    response.raise_for_status()
+    return parse_libgen_search(response.text)
+
 
-    direct_download_url = get_link_tag['href']
+
+def download_libgen_file(book_detail_url: str) -> list[BytesIO, str]:
+    """
+    Downloads the file from LibGen and returns it as BytesIO along with a filename.
+    Blocking; the API uses the pooled async client in libgen_client.py.
+    """
+    response = requests.get(book_detail_url)
+    response.raise_for_status()
+    mirror_url = parse_mirror_link(response.text, book_detail_url)
+
+    mirror_response = requests.get(mirror_url)
+    mirror_response.raise_for_status()
+    direct_download_url = parse_download_link(mirror_response.text)
 
     # Download the file
     file_response = requests.get(direct_download_url)
     file_response.raise_for_status()
 
-    # Try to extract a filename from headers
-    content_disposition = file_response.headers.get('content-disposition')
-    filename = None
-    if content_disposition:
-        parts = content_disposition.split(';')
-        for part in parts:
-            if 'filename=' in part:
-                filename = part.split('=')[1].strip('"')
-                break
-
-    if not filename:
-        # If no filename found, fallback
-        filename = direct_download_url.split('/')[-1]
-
+    filename = download_filename(file_response.headers, direct_download_url)
     file_bytes = BytesIO(file_response.content)
     return file_bytes, filename
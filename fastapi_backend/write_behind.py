@@ -0,0 +1,125 @@
+import asyncio
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+
+class ChatWriteBuffer:
+    """
+    Write-behind buffer for chat turns.
+
+    Messages and session `last_active` bumps are kept in memory and written in
+    batches: one insert_many for all buffered messages and one bulk_write of
+    `$max` updates for the sessions they belong to. A flush happens every
+    `flush_interval` seconds, or as soon as `max_batch` messages are waiting.
+
+    Message `_id`s are generated by the caller, so a batch that partially
+    failed can be retried as is; already stored messages surface as duplicate
+    key errors and are ignored.
+
+    Attributes:
+        messages: Motor collection holding chat messages.
+        sessions: Motor collection holding chat sessions.
+        max_batch: Number of buffered messages that triggers an early flush.
+        flush_interval: Maximum time in seconds a message waits in the buffer.
+    """
+    def __init__(self, messages, sessions, max_batch: int, flush_interval: float):
+        self.messages = messages
+        self.sessions = sessions
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending_messages = []
+        self._pending_last_active = {}
+        self._wakeup = asyncio.Event()
+        # One flush at a time, so a caller of flush() knows earlier batches are written
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.flushes = 0
+        self.flushed_messages = 0
+
+    def add(self, docs: list, session_id, last_active):
+        self._pending_messages.extend(docs)
+        previous = self._pending_last_active.get(session_id)
+        if previous is None or last_active > previous:
+            self._pending_last_active[session_id] = last_active
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending_messages) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # The batch was put back in the buffer, retry on the next tick
+                print(f"[write-behind] flush failed: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            await self._flush()
+
+    def discard_session(self, session_id):
+        """Drops the buffered messages of a deleted session."""
+        self._pending_messages = [doc for doc in self._pending_messages if doc["session_id"] != session_id]
+        self._pending_last_active.pop(session_id, None)
+
+    async def _flush(self):
+        messages, self._pending_messages = self._pending_messages, []
+        last_active, self._pending_last_active = self._pending_last_active, {}
+        if not messages and not last_active:
+            return
+        session_updates = [
+            UpdateOne({"_id": session_id}, {"$max": {"last_active": timestamp}})
+            for session_id, timestamp in last_active.items()
+        ]
+        results = await asyncio.gather(
+            self.messages.insert_many(messages, ordered=False) if messages else asyncio.sleep(0),
+            self.sessions.bulk_write(session_updates, ordered=False) if session_updates else asyncio.sleep(0),
+            return_exceptions=True
+        )
+        failed = False
+        if isinstance(results[0], BaseException) and not _only_duplicates(results[0]):
+            self._pending_messages[:0] = messages
+            failed = True
+        if isinstance(results[1], BaseException):
+            for session_id, timestamp in last_active.items():
+                current = self._pending_last_active.get(session_id)
+                if current is None or timestamp > current:
+                    self._pending_last_active[session_id] = timestamp
+            failed = True
+        if failed:
+            raise next(r for r in results if isinstance(r, BaseException))
+        self.flushes += 1
+        self.flushed_messages += len(messages)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "buffered_messages": len(self._pending_messages),
+            "flushes": self.flushes,
+            "flushed_messages": self.flushed_messages,
+        }
+
+
+def _only_duplicates(error: BaseException) -> bool:
+    if not isinstance(error, BulkWriteError):
+        return False
+    write_errors = error.details.get("writeErrors", [])
+    return bool(write_errors) and all(e.get("code") == DUPLICATE_KEY for e in write_errors) \
+        and not error.details.get("writeConcernErrors")